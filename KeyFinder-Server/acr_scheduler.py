@@ -0,0 +1,358 @@
+import fcntl
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# --- Priorities (lower runs first) ---
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# ACRCloud status codes that mean "slow down" rather than "no match"
+ACR_LIMIT_EXCEEDED_CODE = 3003
+ACR_QPS_LIMIT_CODE = 3015
+
+
+class SchedulerRejected(Exception):
+    """Base class for requests the scheduler refuses to send to ACRCloud."""
+    reason = 'rejected'
+
+
+class QueueFullError(SchedulerRejected):
+    reason = 'queue_full'
+
+
+class DeadlineExceededError(SchedulerRejected):
+    reason = 'deadline_exceeded'
+
+
+class QuotaExhaustedError(SchedulerRejected):
+    reason = 'quota_exhausted'
+
+
+class _State:
+    """A small JSON-serializable dict shared by every process that opens the same `path`.
+
+    Each update holds an exclusive flock on the file for the whole
+    read-modify-write, so gunicorn workers draw from one bucket and one daily
+    count. Without a path the state is private to this process.
+    """
+
+    def __init__(self, path, initial):
+        self.path = path
+        self.initial = initial
+        self.local = dict(initial)
+        self.lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @contextmanager
+    def update(self):
+        with self.lock:
+            if not self.path:
+                yield self.local
+                return
+            with open(self.path, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                try:
+                    state = {**self.initial, **json.loads(f.read())}
+                except ValueError:
+                    state = dict(self.initial)
+                yield state
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second.
+
+    With `state_path`, every process using that file shares the bucket.
+    """
+
+    def __init__(self, rate, capacity, state_path=None):
+        self.rate = float(rate)
+        self.capacity = float(max(capacity, 1))
+        self.state = _State(state_path, {'tokens': self.capacity, 'updated': time.time()})
+
+    def _refill(self, state, now):
+        elapsed = now - state['updated']
+        if elapsed > 0:
+            state['tokens'] = min(self.capacity, state['tokens'] + elapsed * self.rate)
+        state['updated'] = now
+
+    def try_acquire(self):
+        """Take a token if one is available, otherwise return seconds until one is."""
+        with self.state.update() as state:
+            self._refill(state, time.time())
+            if state['tokens'] >= 1:
+                state['tokens'] -= 1
+                return 0.0
+            return (1 - state['tokens']) / self.rate
+
+    def refund(self):
+        """Return a token taken by try_acquire that was not used."""
+        with self.state.update() as state:
+            self._refill(state, time.time())
+            state['tokens'] = min(self.capacity, state['tokens'] + 1)
+
+    def drain(self, seconds):
+        """Push the bucket into debt so nothing is sent for roughly `seconds`."""
+        with self.state.update() as state:
+            self._refill(state, time.time())
+            state['tokens'] = min(state['tokens'], 0) - seconds * self.rate
+
+
+class DailyQuota:
+    """Counts calls per UTC day and refuses them once `limit` is reached.
+
+    With `state_path`, every process using that file shares the count.
+    """
+
+    def __init__(self, limit, state_path=None):
+        self.limit = limit
+        self.state = _State(state_path, {'day': None, 'used': 0, 'exhausted': False})
+
+    @staticmethod
+    def _roll(state):
+        today = datetime.now(timezone.utc).date().isoformat()
+        if today != state['day']:
+            state.update(day=today, used=0, exhausted=False)
+
+    def try_consume(self):
+        with self.state.update() as state:
+            self._roll(state)
+            if state['exhausted'] or (self.limit and state['used'] >= self.limit):
+                return False
+            state['used'] += 1
+            return True
+
+    def mark_exhausted(self):
+        """ACRCloud told us the daily limit is gone; stop until the next UTC day."""
+        with self.state.update() as state:
+            self._roll(state)
+            state['exhausted'] = True
+
+    def remaining(self):
+        with self.state.update() as state:
+            self._roll(state)
+            if state['exhausted']:
+                return 0
+            return None if not self.limit else max(0, self.limit - state['used'])
+
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'fn', 'args', 'kwargs', 'deadline', 'enqueued', 'future')
+
+    def __init__(self, priority, seq, fn, args, kwargs, deadline):
+        self.priority = priority
+        self.seq = seq
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.future = Future()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ACRCloudScheduler:
+    """Rate-limited, priority-ordered front for ACRCloudRecognizer calls.
+
+    Calls are queued in a bounded priority queue and released by worker
+    threads only when the token bucket and the daily quota allow it. Jobs whose
+    deadline cannot be met are dropped instead of being sent to ACRCloud.
+
+    The queue is per process. With `state_dir`, the bucket and the daily count
+    live in flock'd files there, so `qps` and `daily_limit` hold for all worker
+    processes together rather than for each one.
+    """
+
+    def __init__(self, qps=1.0, burst=1, daily_limit=0, max_queue=32, workers=2, wait_samples=1000,
+                 state_dir=None):
+        self.bucket = TokenBucket(qps, burst, state_dir and os.path.join(state_dir, 'bucket.json'))
+        self.quota = DailyQuota(daily_limit, state_dir and os.path.join(state_dir, 'quota.json'))
+        self.max_queue = max_queue
+        self.queue = []
+        self.cond = threading.Condition()
+        self.seq = itertools.count()
+        self.service_time = 1.0  # EWMA of ACRCloud call duration in seconds
+        self.wait_times = deque(maxlen=wait_samples)
+        self.counters = {
+            'submitted': 0,
+            'completed': 0,
+            'rejected_queue_full': 0,
+            'rejected_quota': 0,
+            'dropped_deadline': 0,
+            'throttled_by_acrcloud': 0,
+        }
+        self.workers = []
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._worker, name=f'acr-scheduler-{i}', daemon=True)
+            t.start()
+            self.workers.append(t)
+
+    # --- Submission ---
+    def submit(self, fn, *args, priority=PRIORITY_INTERACTIVE, deadline=None, **kwargs):
+        """Queue `fn(*args, **kwargs)` and return a Future for its result.
+
+        `deadline` is a time.monotonic() value after which the result is useless.
+        """
+        if self.quota.remaining() == 0:
+            self._count('rejected_quota')
+            raise QuotaExhaustedError('ACRCloud daily quota exhausted')
+
+        with self.cond:
+            if deadline is not None:
+                ahead = sum(1 for j in self.queue if j.priority <= priority)
+                expected = (ahead + 1) / self.bucket.rate + self.service_time
+                if time.monotonic() + expected > deadline:
+                    self.counters['dropped_deadline'] += 1
+                    raise DeadlineExceededError(f'expected wait {expected:.1f}s exceeds deadline')
+
+            job = _Job(priority, next(self.seq), fn, args, kwargs, deadline)
+            if len(self.queue) >= self.max_queue:
+                worst = max(self.queue)
+                if worst.priority <= priority:
+                    self.counters['rejected_queue_full'] += 1
+                    raise QueueFullError('ACRCloud request queue is full')
+                # Evict the least urgent job to make room for a more urgent one
+                self.queue.remove(worst)
+                heapq.heapify(self.queue)
+                self.counters['rejected_queue_full'] += 1
+                if worst.future.set_running_or_notify_cancel():
+                    worst.future.set_exception(QueueFullError('evicted by higher-priority request'))
+
+            heapq.heappush(self.queue, job)
+            self.counters['submitted'] += 1
+            self.cond.notify()
+        return job.future
+
+    def call(self, fn, *args, priority=PRIORITY_INTERACTIVE, timeout=None, **kwargs):
+        """Submit and wait; `timeout` in seconds also becomes the job deadline."""
+        deadline = time.monotonic() + timeout if timeout else None
+        future = self.submit(fn, *args, priority=priority, deadline=deadline, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            if future.cancel():
+                self._count('dropped_deadline')
+            raise DeadlineExceededError('ACRCloud call did not finish before the deadline')
+
+    # --- Workers ---
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+
+            # Take the token before choosing a job, so a job that arrives while
+            # we wait for the token still competes on priority
+            wait = self.bucket.try_acquire()
+            if wait > 0:
+                self._drop_late_jobs(time.monotonic() + wait + self.service_time)
+                time.sleep(min(wait, 0.5))
+                continue
+            job = self._pop_job()
+            if job is None:
+                # Another worker took the job, or every queued job was past its deadline
+                self.bucket.refund()
+                continue
+            if not self.quota.try_consume():
+                self._count('rejected_quota')
+                job.future.set_exception(QuotaExhaustedError('ACRCloud daily quota exhausted'))
+                continue
+
+            self._record_wait(time.monotonic() - job.enqueued)
+            started = time.monotonic()
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                job.future.set_exception(e)
+                continue
+            finally:
+                self.service_time = 0.8 * self.service_time + 0.2 * (time.monotonic() - started)
+
+            self._inspect_status(result)
+            self._count('completed')
+            job.future.set_result(result)
+
+    def _drop(self, job):
+        """Fail a queued job whose deadline can no longer be met (caller holds self.cond)."""
+        self.counters['dropped_deadline'] += 1
+        if job.future.set_running_or_notify_cancel():
+            job.future.set_exception(DeadlineExceededError('deadline passed while queued'))
+
+    def _pop_job(self):
+        """Pop the most urgent job that can still meet its deadline and mark it running, or None."""
+        with self.cond:
+            while self.queue:
+                job = heapq.heappop(self.queue)
+                if job.future.cancelled():
+                    continue
+                if job.deadline is not None and time.monotonic() + self.service_time > job.deadline:
+                    self._drop(job)
+                    continue
+                if job.future.set_running_or_notify_cancel():
+                    return job
+        return None
+
+    def _drop_late_jobs(self, earliest_finish):
+        """Drop queued jobs that could not finish before their deadline even with the next token."""
+        with self.cond:
+            late = [job for job in self.queue if job.deadline is not None and earliest_finish > job.deadline]
+            if not late:
+                return
+            self.queue = [job for job in self.queue if job not in late]
+            heapq.heapify(self.queue)
+            for job in late:
+                self._drop(job)
+
+    def _inspect_status(self, result):
+        """Back off when ACRCloud reports that we hit a rate or daily limit."""
+        try:
+            code = json.loads(result).get('status', {}).get('code')
+        except Exception:
+            return
+        if code == ACR_QPS_LIMIT_CODE:
+            self._count('throttled_by_acrcloud')
+            self.bucket.drain(1.0)
+        elif code == ACR_LIMIT_EXCEEDED_CODE:
+            self._count('throttled_by_acrcloud')
+            self.quota.mark_exhausted()
+
+    # --- Metrics ---
+    def _count(self, name):
+        with self.cond:
+            self.counters[name] += 1
+
+    def _record_wait(self, seconds):
+        with self.cond:
+            self.wait_times.append(seconds)
+
+    def stats(self):
+        with self.cond:
+            waits = sorted(self.wait_times)
+            stats = dict(self.counters)
+            stats['queue_depth'] = len(self.queue)
+        stats['quota_remaining'] = self.quota.remaining()
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 4) if waits else 0.0
+
+        stats['queue_wait_seconds'] = {
+            'p50': pct(0.50),
+            'p95': pct(0.95),
+            'max': round(waits[-1], 4) if waits else 0.0,
+            'samples': len(waits),
+        }
+        return stats
@@ -60,6 +60,7 @@ class ACRCloudRecognizer:
         self.config = config
         self.host = config.get('host', 'ap-southeast-1.api.acrcloud.com')
         self.endpoint = config.get('endpoint', '/v1/identify')
+        self.protocol = config.get('protocol', 'https')
         self.query_type = config.get('query_type', 'fingerprint')
         self.access_key = config.get('access_key')
         self.access_secret = config.get('access_secret')
@@ -164,7 +165,7 @@ class ACRCloudRecognizer:
                 return ACRCloudStatusCode.get_result_error(ACRCloudStatusCode.NOT_HUMMING_ERROR_CODE)
             fields['sample_hum_bytes'] = str(sample_hum_bytes)
 
-        server_url = 'https://' + host + http_url_file
+        server_url = self.protocol + '://' + host + http_url_file
         res = self.post_multipart(server_url, fields, query_data, timeout)
         return res
 
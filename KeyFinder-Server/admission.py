@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+
+import audio_io
+import metrics
+
+# --- Configuration ---
+MIN_DURATION_SECONDS = float(os.getenv('MIN_DURATION_SECONDS', 2))
+MAX_DURATION_SECONDS = float(os.getenv('MAX_DURATION_SECONDS', 7200))  # 0 disables the limit
+MIN_SAMPLE_RATE = int(os.getenv('MIN_SAMPLE_RATE', 8000))
+MAX_SAMPLE_RATE = int(os.getenv('MAX_SAMPLE_RATE', 192000))
+MAX_CHANNELS = int(os.getenv('MAX_CHANNELS', 8))
+MIN_PEAK_DBFS = float(os.getenv('MIN_PEAK_DBFS', -60))
+
+# Loudness is measured on a few short slices spread across the file, decoded at a low rate.
+# Files without a native seekable reader get one contiguous slice of the same length
+# instead, since every slice would cost a decoder launch (ffmpeg) or a decode from the start.
+LOUDNESS_SR = 11025
+LOUDNESS_PROBES = 8
+LOUDNESS_PROBE_SECONDS = 0.5
+
+UPLOAD_REJECTIONS = metrics.Counter(
+    'keyfinder_upload_rejections_total', 'Uploads refused by the upload caps and pre-decode admission checks.',
+    ['reason'])
+
+
+class UploadRejected(Exception):
+    """An upload that fails admission; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, reason, status=422):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+
+
+def reject(message, reason, status=422):
+    """Count a rejection and return the exception to raise."""
+    UPLOAD_REJECTIONS.inc(reason=reason)
+    return UploadRejected(message, reason, status)
+
+
+def _dbfs(amplitude):
+    return round(20 * float(np.log10(max(amplitude, 1e-10))), 1)
+
+
+def probe_windows(duration, seekable=True):
+    """(offset, duration) slices for the loudness probe; the whole clip when it is short."""
+    span = LOUDNESS_PROBES * LOUDNESS_PROBE_SECONDS
+    if duration is None:
+        return [(0.0, span)]
+    if not seekable:
+        return [((duration - span) / 2, span)] if duration > span else None
+    if duration <= 2 * span:
+        return None
+    return [((i + 0.5) * duration / LOUDNESS_PROBES - LOUDNESS_PROBE_SECONDS / 2, LOUDNESS_PROBE_SECONDS)
+            for i in range(LOUDNESS_PROBES)]
+
+
+def loudness(file_path, duration):
+    """Peak and RMS level (dBFS) of the probe slices."""
+    seekable = audio_io.decoder_for(file_path) in ('wav', 'sndfile')
+    y = np.concatenate(audio_io.load_segments(file_path, LOUDNESS_SR, probe_windows(duration, seekable)))
+    if not len(y):
+        return None
+    return {'peak_dbfs': _dbfs(np.max(np.abs(y))), 'rms_dbfs': _dbfs(np.sqrt(np.mean(np.square(y))))}
+
+
+def preflight(file_path):
+    """Header and loudness checks run before the full decode.
+
+    Returns the container header (see audio_io.inspect) plus peak_dbfs and
+    rms_dbfs, or raises UploadRejected naming the first failed check.
+    """
+    header = audio_io.inspect(file_path)
+    if header.get('audio_stream') is False:
+        raise reject("File contains no audio stream", 'no_audio', 415)
+    if header['channels'] is not None and not 0 < header['channels'] <= MAX_CHANNELS:
+        raise reject(f"Unsupported channel count ({header['channels']}); the maximum is {MAX_CHANNELS}",
+                      'channels')
+    if header['sample_rate'] is not None and not MIN_SAMPLE_RATE <= header['sample_rate'] <= MAX_SAMPLE_RATE:
+        raise reject(f"Unsupported sample rate ({header['sample_rate']} Hz); "
+                      f"expected {MIN_SAMPLE_RATE}-{MAX_SAMPLE_RATE} Hz", 'sample_rate')
+    duration = header['duration']
+    if duration is not None and duration < MIN_DURATION_SECONDS:
+        raise reject(f"Audio clip too short (minimum {MIN_DURATION_SECONDS:g} seconds required)", 'too_short')
+    if duration is not None and MAX_DURATION_SECONDS > 0 and duration > MAX_DURATION_SECONDS:
+        raise reject(f"Audio too long ({duration / 60:.1f} min); "
+                      f"the maximum is {MAX_DURATION_SECONDS / 60:.1f} min", 'too_long', 413)
+
+    try:
+        level = loudness(file_path, duration)
+    except Exception as e:
+        print(f"Preflight decode error: {e}")
+        raise reject("Unrecognized or corrupt audio file", 'undecodable', 415)
+    if level is None:
+        raise reject("Unrecognized or corrupt audio file", 'undecodable', 415)
+    if level['peak_dbfs'] < MIN_PEAK_DBFS:
+        raise reject("Audio appears to be silent or too quiet", 'silent')
+    header.update(level)
+    return header
@@ -0,0 +1,126 @@
+import fcntl
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+
+from audio_analysis import merge_statistics
+
+# --- Configuration ---
+ANALYSIS_SESSION_TTL_SECONDS = float(os.getenv('ANALYSIS_SESSION_TTL_SECONDS', 24 * 3600))
+ANALYSIS_SESSION_MAX_CLIPS = int(os.getenv('ANALYSIS_SESSION_MAX_CLIPS', 50))
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+def _to_json(stats):
+    if stats is None:
+        return None
+    return {name: value.tolist() if isinstance(value, np.ndarray) else
+            _to_json(value) if isinstance(value, dict) else value
+            for name, value in stats.items()}
+
+
+class AnalysisSessions:
+    """Multi-clip analysis sessions: each clip's mergeable statistics are folded into a running total.
+
+    A session is one JSON file in `folder` holding the merged statistics and
+    the content hashes of its clips, so re-sending a clip does not count it
+    twice. Updates hold an exclusive lock on a `.lock` file beside it, so
+    concurrent clips from different workers are all merged, and replace the
+    JSON file whole, so readers never see it half-written.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, session_id):
+        if len(session_id) != 32 or any(c not in '0123456789abcdef' for c in session_id):
+            raise SessionNotFound(session_id)
+        return os.path.join(self.folder, session_id + '.json')
+
+    def _save(self, session):
+        path = self._path(session['session_id'])
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}"
+        with open(tmp_path, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp_path, path)
+
+    def _remove(self, path):
+        """Delete a session file and its lock file."""
+        os.remove(path)
+        try:
+            os.remove(path[:-len('.json')] + '.lock')
+        except OSError:
+            pass
+
+    def sweep(self):
+        """Delete expired sessions (and temp files left by an interrupted update)."""
+        cutoff = time.time() - ANALYSIS_SESSION_TTL_SECONDS
+        for name in os.listdir(self.folder):
+            if name.endswith('.lock'):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if name.endswith('.json'):
+                    self._remove(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def create(self):
+        self.sweep()
+        session_id = uuid.uuid4().hex
+        session = {'session_id': session_id, 'created': time.time(), 'clip_hashes': [], 'statistics': None}
+        self._save(session)
+        return session
+
+    def get(self, session_id):
+        """The session dict (merged statistics as lists), or SessionNotFound."""
+        path = self._path(session_id)
+        try:
+            if time.time() - os.path.getmtime(path) > ANALYSIS_SESSION_TTL_SECONDS:
+                self._remove(path)
+                raise SessionNotFound(session_id)
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise SessionNotFound(session_id)
+
+    def add_clip(self, session_id, clip_hash, statistics):
+        """Merge one clip's statistics into the session and return the updated session.
+
+        A clip whose hash is already in the session (or beyond the clip limit)
+        leaves the totals unchanged.
+        """
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            raise SessionNotFound(session_id)
+        with open(path[:-len('.json')] + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    session = json.load(f)
+            except (OSError, ValueError):
+                raise SessionNotFound(session_id)
+            if clip_hash not in session['clip_hashes'] and len(session['clip_hashes']) < ANALYSIS_SESSION_MAX_CLIPS:
+                if session['statistics'] is not None:
+                    statistics = merge_statistics(session['statistics'], statistics)
+                session['statistics'] = _to_json(statistics)
+                session['clip_hashes'].append(clip_hash)
+                self._save(session)
+        return session
+
+    def delete(self, session_id):
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            raise SessionNotFound(session_id)
+        self._remove(path)
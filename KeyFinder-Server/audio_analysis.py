@@ -0,0 +1,723 @@
+import os
+
+import librosa
+import numpy as np
+
+import filter_cache
+
+filter_cache.install()
+
+# --- Key & BPM Detection Profiles ---
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+ANALYSIS_SR = 22050
+HOP_LENGTH = 512
+CHROMA_BINS_PER_OCTAVE = 36  # librosa.feature.chroma_cqt default
+# Tuning is rounded to 1/20 of a CQT bin (~1.7 cents) so the cached filter banks can be reused
+TUNING_STEPS = 20
+TUNING_EXCERPT_SECONDS = 10.0
+FEATURE_FRAME_LENGTH = 2048
+
+
+# --- Tempo ---
+TEMPO_MIN, TEMPO_MAX = 60, 200      # range reported to the app; other octaves are folded into it
+SEARCH_MIN, SEARCH_MAX = 30, 300    # range scored by the autocorrelation
+TEMPO_PRIOR_CENTER = 120
+TEMPO_PRIOR_OCTAVES = 1.0
+METRICAL_LEVELS = 4
+
+
+def _autocorrelation(env):
+    """Unbiased autocorrelation of a zero-mean envelope via one FFT round trip."""
+    env = env - env.mean()
+    n = len(env)
+    size = 1 << (2 * n - 1).bit_length()
+    spectrum = np.fft.rfft(env, size)
+    ac = np.fft.irfft(spectrum * np.conj(spectrum), size)[:n]
+    ac /= n - np.arange(n)
+    return ac / ac[0] if ac[0] > 0 else ac
+
+
+def _tempo_strength(ac, frame_rate, bpm):
+    """Metrical comb score: periodicity at the beat lag and its multiples, times a log-tempo prior."""
+    bpm = np.asarray(bpm, dtype=float)
+    lag = 60.0 * frame_rate / bpm
+    frames = np.arange(len(ac))
+    score = np.zeros_like(lag)
+    for k in range(1, METRICAL_LEVELS + 1):
+        valid = k * lag < len(ac) - 1
+        score += np.where(valid, np.interp(k * lag, frames, ac), 0.0) / k
+    prior = np.exp(-0.5 * (np.log2(bpm / TEMPO_PRIOR_CENTER) / TEMPO_PRIOR_OCTAVES) ** 2)
+    return np.maximum(score, 0.0) * prior
+
+
+def _max_tempo_lag(frame_rate):
+    """Longest autocorrelation lag any tempo score reads (every metrical level of the slowest tempo)."""
+    return METRICAL_LEVELS * int(np.ceil(60.0 * frame_rate / SEARCH_MIN)) + 2
+
+
+def tempo_statistics(onset_envelope, frame_rate):
+    """Mergeable tempo summary of one or more onset envelopes, or None if none has onsets.
+
+    Holds the length-weighted sum of their autocorrelations (up to the longest
+    lag the tempo scores read), the total length and the shortest length.
+    """
+    if not isinstance(onset_envelope, (list, tuple)):
+        onset_envelope = [onset_envelope]
+    envelopes = [np.asarray(env, dtype=float) for env in onset_envelope if np.any(np.asarray(env) > 0)]
+    if not envelopes:
+        return None
+    shortest = min(len(env) for env in envelopes)
+    keep = min(shortest, _max_tempo_lag(frame_rate))
+    return {
+        'frame_rate': float(frame_rate),
+        'ac_sum': sum(_autocorrelation(env)[:keep] * len(env) for env in envelopes),
+        'weight': sum(len(env) for env in envelopes),
+        'shortest': shortest,
+    }
+
+
+def _at_frame_rate(stats, frame_rate):
+    """tempo_statistics re-expressed at another onset frame rate.
+
+    The autocorrelation is normalized per lag, so it is interpolated onto the
+    new lag grid; lengths (and the length-weighted sum) scale with the rate.
+    """
+    if np.isclose(stats['frame_rate'], frame_rate):
+        return stats
+    ratio = frame_rate / stats['frame_rate']
+    ac_sum = np.asarray(stats['ac_sum'], dtype=float)
+    n = int((len(ac_sum) - 1) * ratio) + 1
+    return {
+        'frame_rate': float(frame_rate),
+        'ac_sum': np.interp(np.arange(n) / ratio, np.arange(len(ac_sum)), ac_sum) * ratio,
+        'weight': stats['weight'] * ratio,
+        'shortest': int(stats['shortest'] * ratio),
+    }
+
+
+def merge_tempo_statistics(a, b):
+    """Combine two tempo_statistics results (either may be None), at the frame rate of `a`."""
+    if a is None or b is None:
+        return a if b is None else b
+    b = _at_frame_rate(b, a['frame_rate'])
+    n = min(len(a['ac_sum']), len(b['ac_sum']))
+    return {
+        'frame_rate': a['frame_rate'],
+        'ac_sum': np.asarray(a['ac_sum'][:n]) + np.asarray(b['ac_sum'][:n]),
+        'weight': a['weight'] + b['weight'],
+        'shortest': min(a['shortest'], b['shortest']),
+    }
+
+
+def tempo_from_statistics(stats, max_candidates=3):
+    """Tempo estimate (see estimate_tempo) from tempo_statistics; None if no tempo can be found."""
+    if stats is None:
+        return None
+    frame_rate, shortest = stats['frame_rate'], stats['shortest']
+    ac = np.asarray(stats['ac_sum']) / stats['weight']
+
+    # Only lags with at least two periods in every excerpt are trusted
+    longest = min(int(np.ceil(60.0 * frame_rate / SEARCH_MIN)), shortest // 2)
+    lags = np.arange(max(1, int(60.0 * frame_rate / SEARCH_MAX)), longest + 1)
+    if len(lags) < 3:
+        return None
+    strength = _tempo_strength(ac, frame_rate, 60.0 * frame_rate / lags)
+    inner = np.arange(1, len(strength) - 1)
+    peaks = inner[(strength[inner] > 0) & (strength[inner] >= strength[inner - 1]) & (strength[inner] > strength[inner + 1])]
+    if not len(peaks):
+        return None
+
+    candidates = []
+    for i in peaks:
+        # Parabolic interpolation for sub-frame lag precision
+        a, b, c = strength[i - 1], strength[i], strength[i + 1]
+        denom = a - 2 * b + c
+        shift = 0.5 * (a - c) / denom if denom else 0.0
+        candidates.append((float(60.0 * frame_rate / (lags[i] + shift)), float(b - 0.25 * (a - c) * shift)))
+    candidates.sort(key=lambda x: x[1], reverse=True)
+    total = sum(score for _, score in candidates)
+
+    # Resolve the octave: the best-scoring of T/2, T, 2T inside the reported range
+    best = candidates[0][0]
+    octaves = [t for t in (best / 2, best, best * 2) if TEMPO_MIN <= t <= TEMPO_MAX] or [best]
+    octave_scores = _tempo_strength(ac, frame_rate, octaves)
+    bpm = float(octaves[int(np.argmax(octave_scores))])
+    half, double = _tempo_strength(ac, frame_rate, [bpm / 2, bpm * 2])
+    own = float(_tempo_strength(ac, frame_rate, [bpm])[0]) or 1.0
+
+    return {
+        'bpm': int(np.round(bpm)),
+        'confidence': round(100 * candidates[0][1] / total, 1),
+        'candidates': [{'bpm': round(t, 1), 'confidence': round(100 * score / total, 1)}
+                       for t, score in candidates[:max_candidates]],
+        'half_time': {'bpm': round(bpm / 2, 1), 'relative_strength': round(float(half) / own, 3)},
+        'double_time': {'bpm': round(bpm * 2, 1), 'relative_strength': round(float(double) / own, 3)},
+    }
+
+
+def estimate_tempo(y=None, sr=ANALYSIS_SR, hop_length=HOP_LENGTH, onset_envelope=None, max_candidates=3):
+    """Single-pass tempo estimate with ranked candidates and half/double-time alternatives.
+
+    The onset envelope is computed once (or passed in) and all candidates are
+    scored from one FFT autocorrelation. `onset_envelope` may also be a list of
+    envelopes from separate excerpts of one track; their autocorrelations are
+    averaged so no lag spans a join. Returns None if no tempo can be found.
+    """
+    if onset_envelope is None:
+        onset_envelope = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
+    return tempo_with_statistics(onset_envelope, sr / hop_length, max_candidates)[0]
+
+
+def tempo_with_statistics(onset_envelope, frame_rate, max_candidates=3):
+    """(estimate_tempo result, tempo_statistics) from one autocorrelation pass; (None, None) on failure."""
+    try:
+        stats = tempo_statistics(onset_envelope, frame_rate)
+        return tempo_from_statistics(stats, max_candidates), stats
+    except Exception as e:
+        print(f"Tempo detection error: {e}")
+        return None, None
+
+
+def detect_tempo(y, sr, hop_length=HOP_LENGTH, onset_envelope=None):
+    """Tempo in BPM, or None when the clip has no detectable beat."""
+    estimate = estimate_tempo(y, sr, hop_length, onset_envelope)
+    return estimate['bpm'] if estimate else None
+
+def key_from_chroma_mean(chroma_mean):
+    """Score a 12-bin chroma summary against every major/minor key profile."""
+    # Normalize chroma
+    chroma_mean = chroma_mean / (np.sum(chroma_mean) + 1e-8)
+
+    scores = []
+    for i in range(12):
+        major_profile = np.roll(MAJOR_PROFILE, i) / np.sum(MAJOR_PROFILE)
+        minor_profile = np.roll(MINOR_PROFILE, i) / np.sum(MINOR_PROFILE)
+
+        # Use correlation coefficient
+        score_maj = np.corrcoef(chroma_mean, major_profile)[0,1]
+        score_min = np.corrcoef(chroma_mean, minor_profile)[0,1]
+
+        # Handle NaN values
+        score_maj = score_maj if not np.isnan(score_maj) else 0
+        score_min = score_min if not np.isnan(score_min) else 0
+
+        scores.append((score_maj, 'Major', NOTE_NAMES[i]))
+        scores.append((score_min, 'Minor', NOTE_NAMES[i]))
+
+    # Sort by score
+    scores.sort(key=lambda x: x[0], reverse=True)
+
+    # Calculate confidence
+    best_score = max(scores[0][0], 0)
+    second_best = max(scores[1][0], 0) if len(scores) > 1 else 0
+    confidence = min(100, max(0, (best_score - second_best) * 100 + 50))
+
+    best = scores[0]
+    alternatives = [f"{s[2]} {s[1]}" for s in scores[1:4] if s[0] > 0.1]
+
+    main_key = f"{best[2]} {best[1]}"
+
+    # Calculate relative key
+    root_idx = NOTE_NAMES.index(best[2])
+    if best[1] == 'Major':
+        rel_idx = (root_idx + 9) % 12
+        relative_key = f"{NOTE_NAMES[rel_idx]} Minor"
+    else:
+        rel_idx = (root_idx + 3) % 12
+        relative_key = f"{NOTE_NAMES[rel_idx]} Major"
+
+    return main_key, confidence, alternatives, relative_key
+
+def frame_features(y, sr, frame_length=FEATURE_FRAME_LENGTH):
+    """Per-frame RMS and spectral flatness from one cheap, non-overlapping STFT."""
+    S = np.abs(librosa.stft(y, n_fft=frame_length, hop_length=frame_length, center=False))
+    rms = librosa.feature.rms(S=S, frame_length=frame_length)[0]
+    flatness = librosa.feature.spectral_flatness(S=S)[0]
+    return rms, flatness
+
+
+def tonal_excerpt(y, sr, seconds, features=None):
+    """The `seconds`-long stretch of `y` with the most loud, non-noisy (tonal) frames.
+
+    `features` is frame_features(y, sr) when the caller already has it.
+    """
+    if len(y) <= seconds * sr:
+        return y
+    rms, flatness = features if features is not None else frame_features(y, sr)
+    window = max(1, int(seconds * sr / FEATURE_FRAME_LENGTH))
+    tonal = np.concatenate([[0.0], np.cumsum(rms * (1.0 - flatness))])
+    start = int(np.argmax(tonal[window:] - tonal[:-window])) * FEATURE_FRAME_LENGTH
+    return y[start:start + int(seconds * sr)]
+
+
+# --- Tonal Frame Gating ---
+GATE_TOP_DB = 30.0             # frames this far below the loud frames are treated as breakdowns
+GATE_MAX_FLATNESS = 0.3        # noise and drum hits are spectrally flat, pitched notes are not
+GATE_MIN_RUN_SECONDS = 0.5     # shorter tonal runs and gaps are absorbed into their neighbours
+GATE_MIN_TONAL_SECONDS = 4.0   # below this, keep the whole clip rather than guess from scraps
+GATE_MAX_KEPT_FRACTION = 0.9   # not worth cutting when nearly everything is tonal
+
+
+def _smooth_mask(mask, min_run):
+    """Fill gaps shorter than `min_run` frames, then drop runs shorter than `min_run`."""
+    mask = mask.copy()
+    for value in (False, True):
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], mask == value, [0]]).astype(int)))
+        for start, end in zip(edges[::2], edges[1::2]):
+            if end - start < min_run:
+                mask[start:end] = not value
+    return mask
+
+
+def tonal_frames(y, sr, features=None):
+    """Boolean mask over FEATURE_FRAME_LENGTH frames: loud enough and not noise-like."""
+    rms, flatness = features if features is not None else frame_features(y, sr)
+    db = librosa.amplitude_to_db(rms, ref=np.percentile(rms, 95) if rms.size else 1.0)
+    mask = (db > -GATE_TOP_DB) & (flatness < GATE_MAX_FLATNESS)
+    return _smooth_mask(mask, max(1, int(GATE_MIN_RUN_SECONDS * sr / FEATURE_FRAME_LENGTH)))
+
+
+def select_tonal(y, sr, features=None):
+    """`y` with quiet, percussive and noisy stretches cut out, so chroma only sees tonal audio.
+
+    Returns (audio, fraction kept). Falls back to the whole clip when too little
+    is tonal or almost everything is.
+    """
+    mask = tonal_frames(y, sr, features)
+    kept = int(mask.sum())
+    if not mask.size or kept >= GATE_MAX_KEPT_FRACTION * mask.size or \
+            kept * FEATURE_FRAME_LENGTH < GATE_MIN_TONAL_SECONDS * sr:
+        return y, 1.0
+    frames = np.flatnonzero(mask)
+    gated = y[:mask.size * FEATURE_FRAME_LENGTH].reshape(mask.size, FEATURE_FRAME_LENGTH)[frames].ravel()
+    return gated, kept / mask.size
+
+
+def estimate_tuning(y, sr, excerpt_seconds=TUNING_EXCERPT_SECONDS, features=None):
+    """Deviation from A440 in CQT bins, from a bounded tonal excerpt.
+
+    Quantized to the cached tuning grid. Pass the result to every chroma/CQT
+    call for the clip so pitch tracking runs once.
+    """
+    excerpt = tonal_excerpt(y, sr, excerpt_seconds, features)
+    tuning = librosa.estimate_tuning(y=excerpt, sr=sr, bins_per_octave=CHROMA_BINS_PER_OCTAVE)
+    return round(tuning * TUNING_STEPS) / TUNING_STEPS
+
+
+def tuning_cents(tuning):
+    return round(tuning * 1200.0 / CHROMA_BINS_PER_OCTAVE, 1)
+
+
+def tuning_grid():
+    """Every tuning estimate_tuning can return."""
+    return [i / TUNING_STEPS for i in range(-TUNING_STEPS // 2, TUNING_STEPS // 2 + 1)]
+
+
+def compute_chroma(y, sr, hop_length=HOP_LENGTH, chroma_type='cqt', tuning=None):
+    """Chromagram of `y`; 'cqt' (default) or the cheaper 'stft' variant."""
+    if chroma_type == 'stft':
+        return librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length)
+    if tuning is None:
+        tuning = estimate_tuning(y, sr)
+    # Use CQT for better frequency resolution
+    return librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=hop_length, tuning=tuning,
+                                      bins_per_octave=CHROMA_BINS_PER_OCTAVE)
+
+def detect_key(y, sr, hop_length=HOP_LENGTH, chroma_type='cqt', chroma=None):
+    """Enhanced key detection with confidence scoring.
+
+    Pass a precomputed `chroma` to reuse it (e.g. for the key timeline).
+    """
+    try:
+        if chroma is None:
+            chroma = compute_chroma(y, sr, hop_length, chroma_type)
+        chroma_mean = np.mean(chroma, axis=1)
+        return key_from_chroma_mean(chroma_mean)
+
+    except Exception as e:
+        print(f"Key detection error: {e}")
+        return "C Major", 0, [], "A Minor"
+
+# --- Segment Planning ---
+SEGMENT_SECONDS = 15.0
+SEGMENT_COUNT = 3
+
+
+def plan_segments(duration, segment_seconds=SEGMENT_SECONDS, count=SEGMENT_COUNT):
+    """(offset, duration) windows to decode from a track of `duration` seconds.
+
+    Long tracks get `count` windows centred at evenly spaced points, which skips
+    the intro and outro. Returns None when the whole track should be decoded:
+    the duration is unknown, or the track is not much longer than the windows.
+    """
+    if not duration or duration < 1.5 * count * segment_seconds:
+        return None
+    centers = [duration * (i + 1) / (count + 1) for i in range(count)]
+    return [(round(c - segment_seconds / 2, 3), segment_seconds) for c in centers]
+
+
+# --- Quality Presets ---
+QUALITY_PRESETS = {
+    'fast': {'sr': 11025, 'hop_length': 1024},
+    'balanced': {'sr': 11025, 'hop_length': 512},
+    'accurate': {'sr': ANALYSIS_SR, 'hop_length': HOP_LENGTH},
+}
+QUALITY_MODES = tuple(QUALITY_PRESETS) + ('adaptive',)
+ADAPTIVE_PASSES = ('fast', 'accurate')
+# Confidence already encodes the gap between the top two keys (50 means a tie)
+ADAPTIVE_MIN_CONFIDENCE = float(os.getenv('ADAPTIVE_MIN_CONFIDENCE', 52))
+
+
+def decode_sample_rate(quality):
+    """Sample rate to decode at so every pass of `quality` can run without re-decoding."""
+    if quality == 'adaptive':
+        return max(QUALITY_PRESETS[name]['sr'] for name in ADAPTIVE_PASSES)
+    return QUALITY_PRESETS[quality]['sr']
+
+
+def tempo_hop_length(sr):
+    """Hop giving the same onset frame rate as HOP_LENGTH at ANALYSIS_SR, whatever `sr` is."""
+    return max(1, int(round(HOP_LENGTH * sr / ANALYSIS_SR)))
+
+
+def analyze_key(y, sr, quality='adaptive', min_confidence=ADAPTIVE_MIN_CONFIDENCE, tuning=None, gate=True,
+                features=None):
+    """Key detection at a quality preset.
+
+    'adaptive' runs the cheap pass first and only pays for the accurate pass
+    when the result is ambiguous. Audio decoded at a higher rate than a pass
+    needs is resampled in memory. Tuning is estimated once (unless given) and
+    shared by every pass. With `gate`, only tonal frames reach the CQT (the
+    returned chroma then no longer lines up with the clip's timeline). The
+    chroma of the last pass is returned so callers can reuse it. Tuning and
+    gating share one frame_features pass (`features`, if the caller has it).
+    """
+    if features is None and gate:
+        features = frame_features(y, sr)
+    if tuning is None:
+        tuning = estimate_tuning(y, sr, features=features)
+    tonal_fraction = 1.0
+    if gate:
+        y, tonal_fraction = select_tonal(y, sr, features)
+    passes = ADAPTIVE_PASSES if quality == 'adaptive' else (quality,)
+    for name in passes:
+        preset = QUALITY_PRESETS[name]
+        y_pass = y if sr == preset['sr'] else librosa.resample(y, orig_sr=sr, target_sr=preset['sr'], res_type='soxr_hq')
+        chroma = compute_chroma(y_pass, preset['sr'], preset['hop_length'], tuning=tuning)
+        key, confidence, alternatives, relative_key = detect_key(y_pass, preset['sr'], preset['hop_length'], chroma=chroma)
+        del y_pass
+        if confidence >= min_confidence:
+            break
+    return {
+        'key': key,
+        'confidence': confidence,
+        'alternatives': alternatives,
+        'relative_key': relative_key,
+        'quality': name,
+        'tuning': tuning,
+        'tonal_fraction': round(tonal_fraction, 3),
+        'chroma': chroma,
+        'sr': preset['sr'],
+        'hop_length': preset['hop_length'],
+    }
+
+# --- Key Timeline ---
+KEY_LABELS = [f"{NOTE_NAMES[i]} {mode}" for mode in ('Major', 'Minor') for i in range(12)]
+
+
+def _zscore(x, axis):
+    x = x - x.mean(axis=axis, keepdims=True)
+    return x / (x.std(axis=axis, keepdims=True) + 1e-12)
+
+
+# 24 x 12 z-scored profiles, so a matrix product gives Pearson correlations
+KEY_TEMPLATES = _zscore(np.array([np.roll(MAJOR_PROFILE, i) for i in range(12)] +
+                                 [np.roll(MINOR_PROFILE, i) for i in range(12)]), axis=1)
+
+
+def windowed_key_scores(chroma, window_frames, hop_frames):
+    """Correlation of every key with every window's mean chroma.
+
+    Window sums come from differences of one cumulative sum, so the cost is
+    O(frames) whatever the window and hop sizes. Returns (scores[24, windows], starts).
+    """
+    n_frames = chroma.shape[1]
+    window_frames = max(1, min(window_frames, n_frames))
+    starts = np.arange(0, n_frames - window_frames + 1, max(1, hop_frames))
+    cumulative = np.concatenate([np.zeros((12, 1)), np.cumsum(chroma, axis=1)], axis=1)
+    window_sums = cumulative[:, starts + window_frames] - cumulative[:, starts]
+    scores = KEY_TEMPLATES @ _zscore(window_sums, axis=0) / 12.0
+    return np.nan_to_num(scores), starts
+
+
+def viterbi_keys(scores, stay_probability=0.95, sharpness=20.0):
+    """Most likely key sequence given per-window correlations (24-state HMM)."""
+    n_states, n_steps = scores.shape
+    log_emit = sharpness * scores
+    log_emit -= np.logaddexp.reduce(log_emit, axis=0, keepdims=True)
+    log_trans = np.full((n_states, n_states), np.log((1 - stay_probability) / (n_states - 1)))
+    np.fill_diagonal(log_trans, np.log(stay_probability))
+
+    delta = log_emit[:, 0] - np.log(n_states)
+    backpointers = np.zeros((n_steps, n_states), dtype=np.int64)
+    for t in range(1, n_steps):
+        candidates = delta[:, None] + log_trans      # [from, to]
+        backpointers[t] = np.argmax(candidates, axis=0)
+        delta = candidates[backpointers[t], np.arange(n_states)] + log_emit[:, t]
+
+    path = np.empty(n_steps, dtype=np.int64)
+    path[-1] = np.argmax(delta)
+    for t in range(n_steps - 1, 0, -1):
+        path[t - 1] = backpointers[t, path[t]]
+    return path
+
+
+def key_timeline(chroma, sr, hop_length=HOP_LENGTH, window_seconds=8.0, hop_seconds=2.0,
+                 stay_probability=0.95, duration=None):
+    """Segment a chromagram into key regions: [{'key', 'start', 'end', 'confidence'}].
+
+    `duration` (the decoded length in seconds) caps the region ends; the last
+    frame usually covers only part of a hop.
+    """
+    frame_seconds = hop_length / float(sr)
+    window_frames = int(round(window_seconds / frame_seconds))
+    scores, starts = windowed_key_scores(chroma, window_frames, int(round(hop_seconds / frame_seconds)))
+    path = viterbi_keys(scores, stay_probability)
+
+    # Each window speaks for the span around its centre
+    centres = (starts + min(window_frames, chroma.shape[1]) / 2.0) * frame_seconds
+    bounds = np.concatenate([[0.0], (centres[:-1] + centres[1:]) / 2.0, [chroma.shape[1] * frame_seconds]])
+    if duration is not None:
+        bounds = np.minimum(bounds, duration)
+    segments = []
+    for i, state in enumerate(path):
+        if segments and segments[-1]['state'] == state:
+            segments[-1]['end'] = bounds[i + 1]
+            segments[-1]['scores'].append(scores[state, i])
+        else:
+            segments.append({'state': state, 'start': bounds[i], 'end': bounds[i + 1], 'scores': [scores[state, i]]})
+
+    return [{
+        'key': KEY_LABELS[seg['state']],
+        'start': round(float(seg['start']), 2),
+        'end': round(float(seg['end']), 2),
+        'confidence': round(float(np.clip(np.mean(seg['scores']), 0, 1)) * 100, 1),
+    } for seg in segments]
+
+
+class StreamingAnalyzer:
+    """Incremental key/BPM estimation over audio that arrives in chunks.
+
+    Chroma and onset strength are computed once per new frame, using a short
+    context on either side so chunk boundaries do not show up. Only the
+    running chroma sum, per-second chroma sums (for the key timeline), the
+    float32 onset envelope and a small sample buffer are kept.
+    """
+
+    CONTEXT_SECONDS = 1.0
+    MIN_BLOCK_SECONDS = 1.0
+    MIN_SEGMENT_SECONDS = 3.0  # shorter inputs are too short for the lowest CQT octave
+    STABLE_UPDATES = 3
+    STABLE_SECONDS = 3.0    # newly analyzed audio the estimate must hold over
+    MIN_CONFIDENT_SECONDS = 4.0
+    CONFIDENT_KEY_SCORE = 60
+    STATS_BLOCK_SECONDS = 1.0
+
+    def __init__(self, input_sr, sr=ANALYSIS_SR, hop_length=HOP_LENGTH):
+        self.sr = sr
+        self.hop_length = hop_length
+        self.context = int(round(self.CONTEXT_SECONDS * sr / hop_length)) * hop_length
+        self.min_block_frames = max(1, int(self.MIN_BLOCK_SECONDS * sr / hop_length))
+        self.min_segment = int(self.MIN_SEGMENT_SECONDS * sr)
+        self.block_frames = max(1, int(round(self.STATS_BLOCK_SECONDS * sr / hop_length)))
+        self.resampler = None
+        if input_sr != sr:
+            import soxr
+            self.resampler = soxr.ResampleStream(input_sr, sr, 1, dtype='float32')
+
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_start = 0   # absolute sample index of buffer[0]
+        self.total_samples = 0
+        self.next_frame = 0     # first frame not yet analyzed
+        self.chroma_sum = np.zeros(12)
+        self.chroma_frames = 0
+        self.block_sums = np.zeros((0, 12))
+        self.onset_chunks = []
+        self.peak = 0.0
+        self.tuning = None      # estimated from the first analyzed segment, then fixed
+        self.history = []       # (analyzed frames, key, bpm), one entry per advance
+
+    def feed(self, samples, last=False):
+        """Add mono float samples at the input rate and analyze every complete frame."""
+        samples = np.asarray(samples, dtype=np.float32)
+        if self.resampler is not None:
+            samples = self.resampler.resample_chunk(samples, last=last)
+        if samples.size:
+            self.peak = max(self.peak, float(np.max(np.abs(samples))))
+            self.buffer = np.concatenate([self.buffer, samples])
+            self.total_samples += samples.size
+
+        available = self.total_samples if last else self.total_samples - self.context
+        end_frame = max(self.next_frame, available // self.hop_length + (1 if last else 0))
+        ready = last or (end_frame - self.next_frame >= self.min_block_frames
+                         and self.total_samples >= self.min_segment)
+        if ready and end_frame > self.next_frame:
+            self._analyze_frames(self.next_frame, end_frame)
+            self.next_frame = end_frame
+
+    def _analyze_frames(self, first, last):
+        # Short blocks reach further back so the CQT always sees MIN_SEGMENT_SECONDS of audio
+        seg_start = min(first * self.hop_length - self.context, self.total_samples - self.min_segment)
+        seg_start = max(self.buffer_start, seg_start // self.hop_length * self.hop_length)
+        seg = self.buffer[seg_start - self.buffer_start:]
+        if len(seg) < self.hop_length:
+            return
+        offset = seg_start // self.hop_length
+        if self.tuning is None:
+            self.tuning = estimate_tuning(seg, self.sr)
+        chroma = compute_chroma(seg, self.sr, self.hop_length, tuning=self.tuning)
+        onset = librosa.onset.onset_strength(y=seg, sr=self.sr, hop_length=self.hop_length)
+        lo, hi = first - offset, min(last - offset, chroma.shape[1])
+        if hi > lo:
+            self.chroma_sum += chroma[:, lo:hi].sum(axis=1)
+            self.chroma_frames += hi - lo
+            self.onset_chunks.append(onset[lo:hi].astype(np.float32))
+            blocks = np.arange(first, first + hi - lo) // self.block_frames
+            if blocks[-1] >= len(self.block_sums):
+                self.block_sums = np.concatenate([self.block_sums, np.zeros((blocks[-1] + 1 - len(self.block_sums), 12))])
+            np.add.at(self.block_sums, blocks, chroma[:, lo:hi].T)
+
+        # Keep only the history needed for the next block
+        keep_from = max(self.buffer_start, min(last * self.hop_length - self.context,
+                                               self.total_samples - self.min_segment))
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+
+    @property
+    def seconds(self):
+        return self.total_samples / self.sr
+
+    def onset_envelope(self):
+        return np.concatenate(self.onset_chunks) if self.onset_chunks else np.zeros(0, dtype=np.float32)
+
+    def tempo(self):
+        """Full estimate_tempo result for everything fed so far."""
+        return estimate_tempo(sr=self.sr, hop_length=self.hop_length, onset_envelope=self.onset_envelope())
+
+    def key_timeline(self, window_seconds=8.0, hop_seconds=2.0):
+        """Key regions from the per-second chroma sums (window and hop snap to whole seconds).
+
+        The last block is usually partial, so region ends are capped at the
+        duration counted from the samples fed.
+        """
+        return key_timeline(self.block_sums.T, self.sr, self.block_frames * self.hop_length,
+                            window_seconds=window_seconds, hop_seconds=hop_seconds, duration=self.seconds)
+
+    def estimate(self):
+        """Current key/BPM estimate with a flag saying whether it has settled."""
+        if not self.chroma_frames or self.peak < 1e-5:
+            return {'seconds': round(self.seconds, 2), 'key': None, 'bpm': None, 'confident': False}
+
+        key, confidence, alternatives, relative_key = key_from_chroma_mean(self.chroma_sum / self.chroma_frames)
+        bpm = detect_tempo(None, self.sr, self.hop_length, onset_envelope=self.onset_envelope())
+
+        # Repeated calls without new frames are not evidence that the estimate has settled
+        if not self.history or self.history[-1][0] < self.next_frame:
+            self.history = self.history[-64:] + [(self.next_frame, key, bpm)]
+        streak = 0
+        for _, k, b in reversed(self.history):
+            if bpm is None or k != key or b is None or abs(b - bpm) > 0.02 * bpm:
+                break
+            streak += 1
+        span = (self.next_frame - self.history[-streak][0]) * self.hop_length / self.sr if streak else 0.0
+        stable = streak >= self.STABLE_UPDATES and span >= self.STABLE_SECONDS
+        return {
+            'seconds': round(self.seconds, 2),
+            'key': key,
+            'key_confidence': round(confidence, 1),
+            'alternative_keys': alternatives,
+            'relative_key': relative_key,
+            'bpm': bpm,
+            'tuning_cents': tuning_cents(self.tuning),
+            'confident': bool(stable and confidence >= self.CONFIDENT_KEY_SCORE
+                              and self.seconds >= self.MIN_CONFIDENT_SECONDS),
+        }
+
+
+def analyze_blocks(blocks, input_sr, timeline=None):
+    """Constant-memory key/BPM analysis of a recording delivered as mono float32 blocks.
+
+    Equivalent to the in-memory accurate path without tonal gating (which needs
+    the whole clip's loudness distribution). Returns None for silent input.
+    """
+    analyzer = StreamingAnalyzer(input_sr)
+    pending = None
+    for block in blocks:
+        if pending is not None:
+            analyzer.feed(pending)
+        pending = block
+    # Hold one block back so the final call can flush the resampler and the last frames
+    analyzer.feed(pending if pending is not None else np.zeros(0, dtype=np.float32), last=True)
+    if not analyzer.chroma_frames or analyzer.peak < 1e-5:
+        return None
+
+    chroma_mean = analyzer.chroma_sum / analyzer.chroma_frames
+    key, confidence, alternatives, relative_key = key_from_chroma_mean(chroma_mean)
+    tempo, tempo_stats = tempo_with_statistics(analyzer.onset_envelope(), analyzer.sr / analyzer.hop_length)
+    result = {
+        'key': key,
+        'confidence': confidence,
+        'alternatives': alternatives,
+        'relative_key': relative_key,
+        'tempo': tempo,
+        'tuning': analyzer.tuning,
+        'seconds': analyzer.seconds,
+        'statistics': clip_statistics(chroma_mean, analyzer.seconds, tempo_stats),
+    }
+    if timeline is not None:
+        result['key_timeline'] = analyzer.key_timeline(timeline.get('window', 8.0), timeline.get('hop', 2.0))
+    return result
+
+# --- Mergeable Clip Statistics ---
+def clip_statistics(chroma_mean, seconds, tempo_stats):
+    """Sufficient statistics of one clip for a combined multi-clip key/BPM estimate.
+
+    The key part is the clip's mean chroma weighted by its duration (so clips
+    analyzed at different hops count by length, not frame count); the tempo part
+    is the tempo_statistics the clip's own tempo estimate was read from, so no
+    second autocorrelation pass is needed. Clips combine with merge_statistics
+    in any order.
+    """
+    return {
+        'clips': 1,
+        'seconds': float(seconds),
+        'chroma_sum': np.asarray(chroma_mean, dtype=float) * seconds,
+        'tempo': tempo_stats,
+    }
+
+
+def merge_statistics(a, b):
+    """Combine two clip_statistics (or earlier merge_statistics) results."""
+    return {
+        'clips': a['clips'] + b['clips'],
+        'seconds': a['seconds'] + b['seconds'],
+        'chroma_sum': np.asarray(a['chroma_sum']) + np.asarray(b['chroma_sum']),
+        'tempo': merge_tempo_statistics(a['tempo'], b['tempo']),
+    }
+
+
+def estimate_from_statistics(stats):
+    """Key and tempo for merged statistics, scored exactly as for a single clip."""
+    key, confidence, alternatives, relative_key = key_from_chroma_mean(np.asarray(stats['chroma_sum']) / stats['seconds'])
+    return {
+        'key': key,
+        'confidence': confidence,
+        'alternatives': alternatives,
+        'relative_key': relative_key,
+        'tempo': tempo_from_statistics(stats['tempo']),
+        'clips': stats['clips'],
+        'seconds': stats['seconds'],
+    }
@@ -0,0 +1,320 @@
+import json
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+# --- Configuration ---
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY') or shutil.which('ffmpeg')
+FFPROBE_BINARY = os.getenv('FFPROBE_BINARY') or shutil.which('ffprobe')
+FFPROBE_TIMEOUT_SECONDS = 10
+# Wall-clock limit for one ffmpeg decode; a stuck or pathologically slow one is killed
+FFMPEG_TIMEOUT_SECONDS = float(os.getenv('FFMPEG_TIMEOUT_SECONDS', 120))
+# 'auto' picks a decoder from the file's magic bytes: memory-mapped PCM for WAV, libsndfile
+# for AIFF/FLAC/OGG, ffmpeg (when installed) for m4a/aac/mp3; 'ffmpeg' and 'librosa' force one
+AUDIO_DECODER = os.getenv('AUDIO_DECODER', 'auto')
+
+SNDFILE_FORMATS = ('wav', 'aiff', 'flac', 'ogg')
+# (format tag, bits per sample) -> numpy dtype and the scale librosa/libsndfile use for it
+WAV_SAMPLE_TYPES = {
+    (1, 8): ('u1', 128.0),
+    (1, 16): ('<i2', 32768.0),
+    (1, 32): ('<i4', 2147483648.0),
+    (3, 32): ('<f4', 1.0),
+}
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+PIPE_CHUNK_BYTES = 1 << 20
+# How much of ffmpeg's stderr goes into the error message
+FFMPEG_ERROR_TAIL_BYTES = 4096
+
+
+def probe_duration(file_path):
+    """Duration in seconds from container metadata, without decoding; None if unknown."""
+    # libsndfile reads WAV/FLAC/OGG/AIFF headers directly
+    try:
+        return sf.info(file_path).duration
+    except Exception:
+        pass
+
+    # ACRCloud's extractor understands the compressed containers (m4a, mp3, aac ...)
+    try:
+        from acrcloud.recognizer import ACRCloudRecognizer
+        duration_ms = ACRCloudRecognizer.get_duration_ms_by_file(file_path)
+        if duration_ms:
+            return duration_ms / 1000.0
+    except Exception:
+        pass
+
+    try:
+        return librosa.get_duration(path=file_path)
+    except Exception as e:
+        print(f"Duration probe error: {e}")
+        return None
+
+
+def _ffprobe(file_path):
+    """Codec, rate, channels and duration of the first audio stream; {} if ffprobe can't tell."""
+    command = [FFPROBE_BINARY, '-v', 'error', '-select_streams', 'a:0', '-of', 'json',
+               '-show_entries', 'stream=codec_name,sample_rate,channels:format=duration', file_path]
+    try:
+        output = subprocess.run(command, capture_output=True, timeout=FFPROBE_TIMEOUT_SECONDS, check=True).stdout
+        probe = json.loads(output or '{}')
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return {}
+    streams = probe.get('streams') or [{}]
+    duration = probe.get('format', {}).get('duration')
+    return {
+        'codec': streams[0].get('codec_name'),
+        'sample_rate': int(streams[0]['sample_rate']) if streams[0].get('sample_rate') else None,
+        'channels': streams[0].get('channels'),
+        'duration': float(duration) if duration else None,
+        'audio_stream': bool(probe.get('streams')),
+    }
+
+
+def inspect(file_path):
+    """Container facts read from the header, without decoding any audio.
+
+    Returns format, codec, duration, sample_rate and channels; fields the
+    available tools can't read are None.
+    """
+    header = {'format': sniff_format(file_path), 'codec': None, 'duration': None,
+              'sample_rate': None, 'channels': None}
+    if header['format'] in SNDFILE_FORMATS:
+        try:
+            info = sf.info(file_path)
+            header.update(codec=info.subtype, duration=info.duration,
+                          sample_rate=info.samplerate, channels=info.channels)
+        except Exception:
+            pass
+        return header
+    if FFPROBE_BINARY:
+        header.update(_ffprobe(file_path))
+    if header['duration'] is None and header.get('audio_stream', True):
+        header['duration'] = probe_duration(file_path)
+    return header
+
+
+# --- Format Sniffing ---
+def sniff_format(file_path):
+    """Container type from the first bytes of the file, or None if unrecognized."""
+    with open(file_path, 'rb') as f:
+        head = f.read(12)
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[:4] == b'FORM' and head[8:12] in (b'AIFF', b'AIFC'):
+        return 'aiff'
+    if head[:4] == b'fLaC':
+        return 'flac'
+    if head[:4] == b'OggS':
+        return 'ogg'
+    if head[4:8] == b'ftyp':
+        return 'mp4'
+    if head[:3] == b'ID3' or head[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+        return 'mp3'
+    if head[:4] == b'ADIF' or head[:2] in (b'\xff\xf1', b'\xff\xf9'):
+        return 'aac'
+    return None
+
+
+def decoder_for(file_path):
+    """'wav' (memory-mapped), 'sndfile', 'ffmpeg' or 'librosa'."""
+    if AUDIO_DECODER == 'librosa' or (AUDIO_DECODER == 'ffmpeg' and FFMPEG_BINARY):
+        return AUDIO_DECODER
+    kind = sniff_format(file_path)
+    if kind == 'wav' and wav_layout(file_path):
+        return 'wav'
+    if kind in SNDFILE_FORMATS:
+        return 'sndfile'
+    return 'ffmpeg' if FFMPEG_BINARY else 'librosa'
+
+
+def uses_ffmpeg(file_path):
+    """Whether `file_path` is decoded by the ffmpeg pipe."""
+    return decoder_for(file_path) == 'ffmpeg'
+
+
+# --- WAV / libsndfile Readers ---
+def wav_layout(file_path):
+    """(sample_rate, channels, dtype, scale, data_offset, frames) for plain PCM/float WAV, else None."""
+    with open(file_path, 'rb') as f:
+        if f.read(12)[8:12] != b'WAVE':
+            return None
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, size = header[:4], struct.unpack('<I', header[4:])[0]
+            if chunk_id == b'fmt ':
+                body = f.read(size + size % 2)
+                if size < 16 or len(body) < 16:
+                    # Truncated or garbled format chunk
+                    return None
+                tag, channels, rate = struct.unpack('<HHI', body[:8])
+                bits = struct.unpack('<H', body[14:16])[0]
+                if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26 and len(body) >= 26:
+                    tag = struct.unpack('<H', body[24:26])[0]
+                fmt = (tag, channels, rate, bits)
+            elif chunk_id == b'data':
+                if fmt is None or (fmt[0], fmt[3]) not in WAV_SAMPLE_TYPES or not fmt[1] or not fmt[2]:
+                    return None
+                tag, channels, rate, bits = fmt
+                dtype, scale = WAV_SAMPLE_TYPES[(tag, bits)]
+                offset = f.tell()
+                # Streamed writers leave the size at 0 or 0xFFFFFFFF; trust the file length instead
+                size = min(size, os.path.getsize(file_path) - offset)
+                return rate, channels, dtype, scale, offset, size // (channels * bits // 8)
+            else:
+                f.seek(size + size % 2, 1)
+
+
+def _to_mono(frames, scale):
+    """Downmix (frames, channels) PCM to float32 mono, scaled to [-1, 1)."""
+    y = frames[:, 0] if frames.shape[1] == 1 else frames.mean(axis=1, dtype=np.float32)
+    if y.dtype == np.float32 and scale == 1.0:
+        # Mono float32 input stays a (read-only) view of the memory map
+        return np.asarray(y)
+    y = y.astype(np.float32, copy=False)
+    if frames.dtype == np.uint8:
+        y -= 128
+    if scale != 1.0:
+        y /= np.float32(scale)
+    return y
+
+
+def _resample(y, orig_sr, sr):
+    return y if orig_sr == sr else librosa.resample(y, orig_sr=orig_sr, target_sr=sr, res_type='soxr_hq')
+
+
+def _window(rate, frames, offset, duration):
+    start = min(frames, int(round((offset or 0) * rate)))
+    stop = frames if duration is None else min(frames, start + int(round(duration * rate)))
+    return start, stop
+
+
+def decode_wav(file_path, sr, offset=None, duration=None):
+    """Read PCM straight out of a memory map; mono float32 WAV at `sr` is returned without a copy."""
+    rate, channels, dtype, scale, data_offset, frames = wav_layout(file_path)
+    pcm = np.memmap(file_path, dtype=dtype, mode='r', offset=data_offset, shape=(frames, channels))
+    start, stop = _window(rate, frames, offset, duration)
+    return _resample(_to_mono(pcm[start:stop], scale), rate, sr)
+
+
+def decode_sndfile(file_path, sr, offset=None, duration=None):
+    """Decode AIFF/FLAC/OGG (or non-mappable WAV) with libsndfile, seeking to the window."""
+    with sf.SoundFile(file_path) as f:
+        start, stop = _window(f.samplerate, f.frames, offset, duration)
+        f.seek(start)
+        frames = f.read(stop - start, dtype='float32', always_2d=True)
+        rate = f.samplerate
+    return _resample(_to_mono(frames, 1.0), rate, sr)
+
+
+# --- ffmpeg Pipe Decoder ---
+def _ffmpeg_command(file_path, sr, offset=None, duration=None):
+    command = [FFMPEG_BINARY, '-nostdin', '-hide_banner', '-loglevel', 'error']
+    # Options before -i seek in the demuxer instead of decoding and discarding
+    if offset:
+        command += ['-ss', f'{offset:.3f}']
+    if duration:
+        command += ['-t', f'{duration:.3f}']
+    return command + ['-i', file_path, '-vn', '-ac', '1', '-ar', str(int(sr)), '-f', 'f32le', 'pipe:1']
+
+
+def _ffmpeg_chunks(file_path, sr, offset=None, duration=None, chunk_bytes=PIPE_CHUNK_BYTES):
+    """Raw little-endian float32 mono samples from one ffmpeg process, `chunk_bytes` at a time.
+
+    stderr goes to a temp file rather than a pipe, so a flood of decode errors
+    can't fill the pipe and stall ffmpeg while we wait on stdout.
+    """
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(_ffmpeg_command(file_path, sr, offset, duration),
+                                   stdout=subprocess.PIPE, stderr=stderr)
+        timer = threading.Timer(FFMPEG_TIMEOUT_SECONDS, process.kill)
+        timer.start()
+        try:
+            while True:
+                chunk = process.stdout.read(chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+            if process.wait() != 0 and timer.finished.is_set():
+                raise RuntimeError(f"ffmpeg took longer than {FFMPEG_TIMEOUT_SECONDS:g}s to decode "
+                                   f"{os.path.basename(file_path)}")
+            if process.returncode != 0:
+                stderr.seek(max(0, stderr.seek(0, os.SEEK_END) - FFMPEG_ERROR_TAIL_BYTES))
+                errors = stderr.read().decode('utf-8', 'replace').strip()
+                raise RuntimeError(f"ffmpeg could not decode {os.path.basename(file_path)}: {errors}")
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+
+def decode_ffmpeg(file_path, sr, offset=None, duration=None):
+    """Decode straight to mono float32 at `sr`; resampling and downmixing happen inside ffmpeg."""
+    data = bytearray()
+    for chunk in _ffmpeg_chunks(file_path, sr, offset, duration):
+        data += chunk
+    return np.frombuffer(data, dtype='<f4', count=len(data) // 4)
+
+
+DECODERS = {'wav': decode_wav, 'sndfile': decode_sndfile, 'ffmpeg': decode_ffmpeg}
+
+
+def load_segments(file_path, sr, segments=None):
+    """Decode mono audio at `sr`: the whole file, or each (offset, duration) window.
+
+    Returns a list with one array per window. Every decoder except the librosa
+    fallback seeks to a window rather than decoding from the start.
+    """
+    decoder = decoder_for(file_path)
+    if decoder in DECODERS:
+        return [DECODERS[decoder](file_path, sr, offset, duration) for offset, duration in segments or [(None, None)]]
+    if not segments:
+        return [librosa.load(file_path, sr=sr, mono=True)[0]]
+    return [librosa.load(file_path, sr=sr, mono=True, offset=offset, duration=duration)[0]
+            for offset, duration in segments]
+
+
+def can_stream(file_path):
+    """True if stream_blocks can read the file (WAV/AIFF/FLAC/OGG, anything with ffmpeg)."""
+    return decoder_for(file_path) != 'librosa'
+
+
+def stream_blocks(file_path, sr, block_seconds=10.0):
+    """Open `file_path` for block reading: (sample_rate, iterator of mono float32 blocks).
+
+    ffmpeg-decoded files arrive at `sr` already; libsndfile formats at their native rate.
+    """
+    decoder = decoder_for(file_path)
+    if decoder == 'ffmpeg':
+        chunk_bytes = 4 * int(block_seconds * sr)
+        blocks = (np.frombuffer(chunk, dtype='<f4', count=len(chunk) // 4)
+                  for chunk in _ffmpeg_chunks(file_path, sr, chunk_bytes=chunk_bytes))
+        return sr, blocks
+
+    if decoder == 'wav':
+        rate, channels, dtype, scale, data_offset, frames = wav_layout(file_path)
+        pcm = np.memmap(file_path, dtype=dtype, mode='r', offset=data_offset, shape=(frames, channels))
+        step = int(block_seconds * rate)
+        return rate, (_to_mono(pcm[i:i + step], scale) for i in range(0, frames, step))
+
+    info = sf.info(file_path)
+
+    def blocks():
+        with sf.SoundFile(file_path) as f:
+            for block in f.blocks(blocksize=int(block_seconds * info.samplerate), dtype='float32', always_2d=True):
+                yield block.mean(axis=1)
+
+    return info.samplerate, blocks()
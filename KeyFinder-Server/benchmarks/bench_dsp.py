@@ -0,0 +1,208 @@
+"""Per-stage DSP micro-benchmarks for analyze_audio_locally.
+
+Times load, trim, onset strength, tempo estimation, tuning, tonal gating and
+key detection (at the ANALYSIS_QUALITY preset, or --quality) on deterministic
+synthetic clips, appends the run to a JSON history file and compares it
+against a saved baseline.
+
+    python -m benchmarks.bench_dsp --quick
+    python -m benchmarks.bench_dsp --quality accurate
+    python -m benchmarks.bench_dsp --save-baseline
+    python -m benchmarks.bench_dsp --fail-on-regression --threshold 0.10
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from benchmarks.common import write_json
+from benchmarks.synth import chord_progression, click_track, noise, silence, song, to_upload_format
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+import audio_io  # noqa: E402
+import filter_cache  # noqa: E402
+from audio_analysis import (ANALYSIS_SR, QUALITY_MODES, QUALITY_PRESETS, analyze_key,  # noqa: E402
+                            decode_sample_rate, estimate_tempo, estimate_tuning, frame_features, select_tonal,
+                            tempo_hop_length, tuning_grid)
+
+RESULTS_DIR = os.path.join(SERVER_DIR, 'benchmarks', 'results')
+DEFAULT_HISTORY = os.path.join(RESULTS_DIR, 'dsp_history.json')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'dsp_baseline.json')
+
+DURATIONS = [5, 15, 60, 180, 600]
+QUICK_DURATIONS = [5, 15, 60]
+
+FIXTURES = {
+    'chords': lambda d, sr: chord_progression('A Minor', d, sr, bpm=100),
+    'clicks': lambda d, sr: click_track(128, d, sr),
+    'song': lambda d, sr: song('E Minor', 140, d, sr),
+    'noise': lambda d, sr: noise(d, sr),
+    'silence': lambda d, sr: silence(d, sr),
+}
+
+STAGES = ['load', 'trim', 'onset_strength', 'tempo', 'tuning', 'tonal_gate', 'key']
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - started
+
+
+def run_stages(path, quality):
+    """Run the analyze_audio_locally DSP stages once at `quality`, returning seconds per stage."""
+    timings = {}
+    sr = decode_sample_rate(quality)
+    y, timings['load'] = _timed(lambda: audio_io.load_segments(path, sr)[0])
+    (y, _), timings['trim'] = _timed(lambda: librosa.effects.trim(y, top_db=20))
+    if len(y) < sr * 2 or np.max(np.abs(y)) < 1e-5:
+        # Short and silent clips stop here in the real pipeline as well
+        return timings
+    hop_length = tempo_hop_length(sr)
+    env, timings['onset_strength'] = _timed(lambda: librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length))
+    _, timings['tempo'] = _timed(lambda: estimate_tempo(sr=sr, hop_length=hop_length, onset_envelope=env))
+    # As in the server, one frame_features pass serves the tuning excerpt and the tonal gate
+    features, timings['tuning'] = _timed(lambda: frame_features(y, sr))
+    tuning, tuning_seconds = _timed(lambda: estimate_tuning(y, sr, features=features))
+    timings['tuning'] += tuning_seconds
+    # analyze_key gates internally; gating first and passing gate=False times the two separately
+    (y, _), timings['tonal_gate'] = _timed(lambda: select_tonal(y, sr, features))
+    _, timings['key'] = _timed(lambda: analyze_key(y, sr, quality, tuning=tuning, gate=False))
+    return timings
+
+
+def benchmark(fixtures, durations, repeat, quality):
+    results = {}
+    # Filter banks are built at server startup, so they are not part of a request's cost
+    filter_cache.warm({(p['sr'], p['hop_length']) for p in QUALITY_PRESETS.values()}, tunings=tuning_grid())
+    with tempfile.TemporaryDirectory() as tmp:
+        # Warm up numba-compiled librosa kernels so the first case is not penalized
+        warmup = os.path.join(tmp, 'warmup.wav')
+        sf.write(warmup, song('C Major', 120, 3, ANALYSIS_SR), ANALYSIS_SR, subtype='PCM_16')
+        run_stages(warmup, quality)
+
+        for name in fixtures:
+            for duration in durations:
+                y, sr = to_upload_format(FIXTURES[name](duration, ANALYSIS_SR), ANALYSIS_SR)
+                path = os.path.join(tmp, f'{name}_{duration}s.wav')
+                sf.write(path, y, sr, subtype='PCM_16')
+                del y
+
+                runs = [run_stages(path, quality) for _ in range(repeat)]
+                case = {}
+                for stage in STAGES:
+                    samples = [r[stage] for r in runs if stage in r]
+                    if samples:
+                        case[stage] = {'median_ms': round(1000 * float(np.median(samples)), 3),
+                                       'min_ms': round(1000 * float(np.min(samples)), 3)}
+                case['total_ms'] = round(sum(s['median_ms'] for s in case.values()), 3)
+                results[f'{name}/{duration}s'] = case
+                print(f"{name:>8} {duration:>4}s  " +
+                      '  '.join(f"{stage}={case[stage]['median_ms']:.1f}" for stage in STAGES if stage in case) +
+                      f"  total={case['total_ms']:.1f} ms")
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Return a list of (case, stage, baseline_ms, current_ms, ratio) above `threshold`."""
+    regressions = []
+    for case, stages in results.items():
+        base_case = baseline.get('results', {}).get(case, {})
+        for stage in STAGES + ['total_ms']:
+            current = stages.get(stage)
+            previous = base_case.get(stage)
+            if current is None or previous is None:
+                continue
+            current_ms = current if stage == 'total_ms' else current['median_ms']
+            previous_ms = previous if stage == 'total_ms' else previous['median_ms']
+            if previous_ms <= 0:
+                continue
+            ratio = current_ms / previous_ms
+            # Ignore sub-millisecond jitter
+            if ratio - 1 > threshold and current_ms - previous_ms > 1.0:
+                regressions.append((case, stage, previous_ms, current_ms, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--durations', type=float, nargs='+', help=f'clip lengths in seconds (default {DURATIONS})')
+    parser.add_argument('--quick', action='store_true', help=f'only {QUICK_DURATIONS} seconds')
+    parser.add_argument('--fixtures', nargs='+', choices=sorted(FIXTURES), default=list(FIXTURES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quality', choices=QUALITY_MODES, default=os.getenv('ANALYSIS_QUALITY', 'adaptive'),
+                        help='analysis preset (default: ANALYSIS_QUALITY, as the server uses)')
+    parser.add_argument('--label', help='free-form label stored with the run')
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown reported as regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    durations = args.durations or (QUICK_DURATIONS if args.quick else DURATIONS)
+    results = benchmark(args.fixtures, durations, args.repeat, args.quality)
+    run = {
+        'timestamp': datetime.now().isoformat(),
+        'label': args.label,
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'librosa': librosa.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'quality': args.quality,
+        'results': results,
+    }
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            history = json.load(f)
+    history.append(run)
+    write_json(args.history, history)
+    print(f'Appended run to {args.history} ({len(history)} runs)')
+
+    regressions = []
+    if args.save_baseline:
+        write_json(args.baseline, run)
+        print(f'Saved baseline to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('quality', args.quality) != args.quality:
+            print(f"Note: the baseline was run at quality={baseline['quality']}, this run at {args.quality}")
+        regressions = compare(results, baseline, args.threshold)
+        print(f"Compared against baseline {baseline.get('git_revision')} ({baseline.get('timestamp')})")
+        for case, stage, before, after, ratio in regressions:
+            print(f'  REGRESSION {case} {stage}: {before:.1f} -> {after:.1f} ms ({ratio:.2f}x)')
+        if not regressions:
+            print('  no regressions above threshold')
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
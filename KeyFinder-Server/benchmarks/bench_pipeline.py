@@ -0,0 +1,102 @@
+"""End-to-end benchmark of /analyze (handle_analysis) against local stand-ins.
+
+    python -m benchmarks.bench_pipeline --requests 40 --concurrency 4 --latency fixed:0.2
+
+No network access or credentials are needed: ACRCloud is replaced by the stub
+identify server and Firestore by an in-memory client.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import percentiles, write_json
+from benchmarks.stack import start_stub_stack
+from benchmarks.synth import song, write_wav
+
+CLIP_MIX = [('A Minor', 90, 15), ('C Major', 120, 15), ('E Minor', 140, 30), ('G Major', 100, 10)]
+
+
+def make_clips(directory, sr=22050):
+    paths = []
+    for i, (key, bpm, duration) in enumerate(CLIP_MIX):
+        name = f"clip_{i}_{key.replace(' ', '_')}_{bpm}bpm_{duration}s.wav"
+        paths.append(write_wav(os.path.join(directory, name), song(key, bpm, duration, sr, seed=i), sr))
+    return paths
+
+
+def run(app, clips, requests, concurrency):
+    local = threading.local()
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def one(i):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        path = clips[i % len(clips)]
+        with open(path, 'rb') as f:
+            data = {'audio': (f, os.path.basename(path))}
+            started = time.perf_counter()
+            resp = local.client.post('/analyze', data=data, content_type='multipart/form-data')
+            elapsed = time.perf_counter() - started
+        body = resp.get_json(silent=True) or {}
+        outcome = 'error' if resp.status_code != 200 or 'error' in body else body.get('status', 'unknown')
+        with lock:
+            latencies.append(elapsed)
+            statuses[outcome] = statuses.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(requests / wall, 3),
+        'latency': percentiles(latencies),
+        'outcomes': statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--latency', default='lognormal:0.3:0.4', help='stub ACRCloud latency distribution')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--qps-limit-rate', type=float, default=0.0)
+    parser.add_argument('--no-match-rate', type=float, default=0.1)
+    parser.add_argument('--firestore-latency', type=float, default=0.02)
+    parser.add_argument('--acr-qps', type=float, default=1000, help='scheduler QPS (set low to exercise throttling)')
+    parser.add_argument('--output', help='write the JSON summary here')
+    args = parser.parse_args()
+
+    server, stub, firestore = start_stub_stack(args.latency, args.error_rate, args.qps_limit_rate,
+                                               args.no_match_rate, args.firestore_latency, args.acr_qps)
+    with tempfile.TemporaryDirectory() as tmp:
+        clips = make_clips(tmp)
+        if args.warmup:
+            run(server.app, clips, args.warmup, 1)
+        summary = run(server.app, clips, args.requests, args.concurrency)
+
+    summary['stub'] = {'latency': args.latency, 'error_rate': args.error_rate,
+                       'qps_limit_rate': args.qps_limit_rate, 'no_match_rate': args.no_match_rate,
+                       'identify_requests': stub.requests}
+    summary['firestore_writes'] = len(firestore.collection('audio_analyses').docs)
+    summary['acrcloud_scheduler'] = server.acr_scheduler.stats()
+    stub.shutdown()
+
+    print(f"{summary['requests']} requests @ concurrency {summary['concurrency']}: "
+          f"{summary['throughput_rps']} req/s, p50 {summary['latency']['p50_ms']} ms, "
+          f"p95 {summary['latency']['p95_ms']} ms, p99 {summary['latency']['p99_ms']} ms")
+    print(f"outcomes: {summary['outcomes']}")
+    if args.output:
+        write_json(args.output, summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import json
+import os
+
+import numpy as np
+
+
+def percentiles(samples, points=(50, 90, 95, 99)):
+    """Summarize a list of durations (seconds) as milliseconds."""
+    if not samples:
+        return {'count': 0}
+    arr = np.asarray(samples, dtype=float) * 1000.0
+    summary = {'count': int(arr.size), 'mean_ms': round(float(arr.mean()), 2)}
+    for p in points:
+        summary[f'p{p}_ms'] = round(float(np.percentile(arr, p)), 2)
+    summary['max_ms'] = round(float(arr.max()), 2)
+    return summary
+
+
+def write_json(path, data):
+    """Write `data` as indented JSON, creating parent directories."""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, default=str)
@@ -0,0 +1,271 @@
+"""Accuracy-versus-latency evaluation of key/BPM analysis configurations.
+
+Runs detect_key/detect_tempo over a labeled corpus for every configuration in
+a grid of sample rate, hop length, chroma type and analysis window, in
+parallel across cores, and prints a Pareto table of MIREX weighted key score,
+BPM accuracy and wall time.
+
+    python -m benchmarks.eval_accuracy --synthetic 24
+    python -m benchmarks.eval_accuracy --corpus ~/labeled-clips --sr 11025 22050 --hop 512 1024
+    python -m benchmarks.eval_accuracy --quality fast balanced accurate adaptive
+
+A labeled corpus is any directory of audio files with a JSON sidecar next to
+each one (song.m4a -> song.json) containing {"key": "A Minor", "bpm": 120}.
+Either field may be omitted.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.common import write_json
+from benchmarks.synth import NOTE_NAMES, song, write_wav
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.flac', '.ogg', '.aac', '.aiff', '.aif')
+SYNTHETIC_BPMS = [78, 95, 110, 124, 140, 160, 174]
+
+
+# --- Scoring ---
+def parse_key(key):
+    root, mode = key.split()
+    return NOTE_NAMES.index(root), mode.lower()
+
+
+def mirex_key_score(reference, estimate):
+    """MIREX weighted key score: 1 exact, 0.5 fifth, 0.3 relative, 0.2 parallel, else 0."""
+    ref_root, ref_mode = parse_key(reference)
+    est_root, est_mode = parse_key(estimate)
+    if ref_mode == est_mode:
+        if ref_root == est_root:
+            return 1.0
+        if (est_root - ref_root) % 12 == 7:
+            return 0.5
+    else:
+        if ref_mode == 'major' and (ref_root - est_root) % 12 == 3:
+            return 0.3
+        if ref_mode == 'minor' and (est_root - ref_root) % 12 == 3:
+            return 0.3
+        if ref_root == est_root:
+            return 0.2
+    return 0.0
+
+
+def bpm_accuracy(reference, estimate, tolerance=0.04):
+    """(Acc1, Acc2): within 4% of the reference, and also at 2x, 1/2x, 3x or 1/3x."""
+    if not reference or not estimate:
+        return 0.0, 0.0
+    acc1 = abs(estimate - reference) <= tolerance * reference
+    acc2 = any(abs(estimate - reference * f) <= tolerance * reference * f for f in (1, 2, 0.5, 3, 1 / 3))
+    return float(acc1), float(acc2)
+
+
+# --- Corpus ---
+def synthetic_corpus(directory, count, duration):
+    keys = [f'{n} {m}' for m in ('Major', 'Minor') for n in NOTE_NAMES]
+    items = []
+    for i in range(count):
+        key = keys[(i * 7) % len(keys)]
+        bpm = SYNTHETIC_BPMS[i % len(SYNTHETIC_BPMS)]
+        path = os.path.join(directory, f"synthetic_{i:03d}_{key.replace(' ', '_').replace('#', 's')}_{bpm}.wav")
+        write_wav(path, song(key, bpm, duration, seed=i))
+        items.append({'path': path, 'key': key, 'bpm': bpm})
+    return items
+
+
+def labeled_corpus(directory):
+    items = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if not name.lower().endswith(AUDIO_EXTENSIONS):
+                continue
+            sidecar = os.path.join(root, os.path.splitext(name)[0] + '.json')
+            if not os.path.exists(sidecar):
+                continue
+            with open(sidecar) as f:
+                labels = json.load(f)
+            items.append({'path': os.path.join(root, name), 'key': labels.get('key'), 'bpm': labels.get('bpm')})
+    return items
+
+
+# --- Evaluation ---
+def config_name(config):
+    if 'quality' in config:
+        return f"quality={config['quality']}"
+    window = f"{config['window']}s" if config['window'] else 'full'
+    return f"sr={config['sr']} hop={config['hop']} {config['chroma']} win={window}"
+
+
+def warm_up(configs, path):
+    """Worker initializer: run every configuration once, untimed, before anything is timed.
+
+    Numba compilation, CQT filter banks and resamplers are built per sample
+    rate and hop, so warming only one path would charge the others' setup to
+    whichever configuration happens to run first.
+    """
+    import librosa
+    from audio_analysis import analyze_key
+    item = {'path': path, 'key': None, 'bpm': None}
+    for config in configs:
+        evaluate_one((config, item))
+        if config.get('quality') == 'adaptive':
+            # Force the refinement pass, which the warm-up clip may not need
+            y, sr = librosa.load(path, sr=None, mono=True)
+            analyze_key(y, sr, 'adaptive', min_confidence=101)
+
+
+def evaluate_one(task):
+    """Worker: analyze one clip with one configuration and score it."""
+    config, item = task
+    import librosa
+    from audio_analysis import detect_key, detect_tempo
+
+    if 'quality' in config:
+        return evaluate_preset(config, item)
+
+    started = time.perf_counter()
+    y, sr = librosa.load(item['path'], sr=config['sr'], mono=True)
+    y, _ = librosa.effects.trim(y, top_db=20)
+    if config['window'] and len(y) > config['window'] * sr:
+        # Analyze a centered excerpt of the requested length
+        start = (len(y) - int(config['window'] * sr)) // 2
+        y = y[start:start + int(config['window'] * sr)]
+    bpm = detect_tempo(y, sr, hop_length=config['hop'])
+    key = detect_key(y, sr, hop_length=config['hop'], chroma_type=config['chroma'])[0]
+    elapsed = time.perf_counter() - started
+    return score(config, item, key, bpm, elapsed)
+
+
+def evaluate_preset(config, item):
+    """Worker: run the /analyze DSP path at one quality preset."""
+    import librosa
+    from audio_analysis import analyze_key, decode_sample_rate, detect_tempo, tempo_hop_length
+
+    started = time.perf_counter()
+    y, sr = librosa.load(item['path'], sr=decode_sample_rate(config['quality']), mono=True)
+    y, _ = librosa.effects.trim(y, top_db=20)
+    bpm = detect_tempo(y, sr, hop_length=tempo_hop_length(sr))
+    analysis = analyze_key(y, sr, config['quality'])
+    elapsed = time.perf_counter() - started
+    result = score(config, item, analysis['key'], bpm, elapsed)
+    result['final_pass'] = analysis['quality']
+    return result
+
+
+def score(config, item, key, bpm, elapsed):
+    result = {'config': config_name(config), 'path': item['path'], 'seconds': elapsed,
+              'key': key, 'bpm': bpm, 'ref_key': item['key'], 'ref_bpm': item['bpm']}
+    if item['key']:
+        result['key_score'] = mirex_key_score(item['key'], key)
+    if item['bpm']:
+        result['acc1'], result['acc2'] = bpm_accuracy(item['bpm'], bpm)
+    return result
+
+
+def summarize(configs, results):
+    rows = []
+    for config in configs:
+        name = config_name(config)
+        mine = [r for r in results if r['config'] == name]
+        key_scores = [r['key_score'] for r in mine if 'key_score' in r]
+        acc1 = [r['acc1'] for r in mine if 'acc1' in r]
+        acc2 = [r['acc2'] for r in mine if 'acc2' in r]
+        seconds = [r['seconds'] for r in mine]
+        rows.append({
+            'config': name,
+            'params': config,
+            'clips': len(mine),
+            'key_weighted': round(float(np.mean(key_scores)), 4) if key_scores else None,
+            'key_exact': round(float(np.mean([s == 1.0 for s in key_scores])), 4) if key_scores else None,
+            'bpm_acc1': round(float(np.mean(acc1)), 4) if acc1 else None,
+            'bpm_acc2': round(float(np.mean(acc2)), 4) if acc2 else None,
+            'total_seconds': round(float(np.sum(seconds)), 3),
+            'mean_ms_per_clip': round(1000 * float(np.mean(seconds)), 1) if seconds else None,
+        })
+
+    # A configuration is Pareto-optimal if nothing is at least as fast and at least as accurate
+    def objectives(row):
+        return (-(row['mean_ms_per_clip'] or 0), row['key_weighted'] or 0, row['bpm_acc2'] or 0)
+
+    for row in rows:
+        mine = objectives(row)
+        row['pareto'] = not any(
+            all(o >= m for o, m in zip(objectives(other), mine)) and objectives(other) != mine
+            for other in rows if other is not row
+        )
+    rows.sort(key=lambda r: r['mean_ms_per_clip'] or 0)
+    return rows
+
+
+def print_table(rows):
+    header = f"{'':2}{'configuration':<38}{'key(w)':>8}{'exact':>8}{'acc1':>8}{'acc2':>8}{'ms/clip':>10}"
+    print(header)
+    print('-' * len(header))
+
+    def fmt(v):
+        return f'{v:.3f}' if v is not None else '-'
+
+    for row in rows:
+        mark = '* ' if row['pareto'] else '  '
+        print(f"{mark}{row['config']:<38}{fmt(row['key_weighted']):>8}{fmt(row['key_exact']):>8}"
+              f"{fmt(row['bpm_acc1']):>8}{fmt(row['bpm_acc2']):>8}{row['mean_ms_per_clip']:>10.1f}")
+    print('* = Pareto-optimal (no configuration is both faster and at least as accurate)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', action='append', default=[], help='directory of audio files with JSON sidecars')
+    parser.add_argument('--synthetic', type=int, default=12, help='number of synthetic clips (0 to disable)')
+    parser.add_argument('--synthetic-duration', type=float, default=20)
+    parser.add_argument('--sr', type=int, nargs='+', default=[11025, 22050])
+    parser.add_argument('--hop', type=int, nargs='+', default=[512, 2048])
+    parser.add_argument('--chroma', nargs='+', choices=['cqt', 'stft'], default=['cqt', 'stft'])
+    parser.add_argument('--window', type=float, nargs='+', default=[0, 10],
+                        help='seconds of audio analyzed (0 = whole clip)')
+    parser.add_argument('--quality', nargs='+', choices=['fast', 'balanced', 'accurate', 'adaptive'],
+                        help='evaluate /analyze quality presets instead of the parameter grid')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help='write per-clip results and the summary as JSON')
+    args = parser.parse_args()
+
+    if args.quality:
+        configs = [{'quality': quality} for quality in args.quality]
+    else:
+        configs = [{'sr': sr, 'hop': hop, 'chroma': chroma, 'window': window or None}
+                   for sr, hop, chroma, window in itertools.product(args.sr, args.hop, args.chroma, args.window)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        items = synthetic_corpus(tmp, args.synthetic, args.synthetic_duration) if args.synthetic else []
+        for directory in args.corpus:
+            items.extend(labeled_corpus(directory))
+        if not items:
+            parser.error('empty corpus: use --synthetic N and/or --corpus DIR')
+        print(f'Evaluating {len(configs)} configurations on {len(items)} clips with {args.jobs} workers')
+
+        warm_path = os.path.join(tmp, 'warm_up.wav')
+        write_wav(warm_path, song('C Major', 120, 12))
+        # Clip-major order, so every configuration runs under the same load over the whole run
+        tasks = [(config, item) for item in items for config in configs]
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=warm_up,
+                                 initargs=(configs, warm_path)) as pool:
+            results = list(pool.map(evaluate_one, tasks, chunksize=max(1, len(tasks) // (4 * args.jobs))))
+        print(f'Finished in {time.perf_counter() - started:.1f} s\n')
+
+    rows = summarize(configs, results)
+    print_table(rows)
+    if args.output:
+        write_json(args.output, {'summary': rows, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
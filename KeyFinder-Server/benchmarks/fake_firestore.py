@@ -0,0 +1,82 @@
+"""In-memory stand-in for the subset of the Firestore client used by server.py."""
+import itertools
+import threading
+import time
+
+_OPS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+}
+
+
+class FakeDocument:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), limit=None):
+        self.collection = collection
+        self.filters = list(filters)
+        self._limit = limit
+
+    def where(self, field, op, value):
+        return FakeQuery(self.collection, self.filters + [(field, _OPS[op], value)], self._limit)
+
+    def limit(self, n):
+        return FakeQuery(self.collection, self.filters, n)
+
+    def stream(self):
+        self.collection.client._delay()
+        with self.collection.client.lock:
+            docs = list(self.collection.docs.items())
+        matched = 0
+        for doc_id, data in docs:
+            if all(op(data.get(field), value) for field, op, value in self.filters):
+                yield FakeDocument(doc_id, data)
+                matched += 1
+                if self._limit is not None and matched >= self._limit:
+                    return
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.docs = {}
+        super().__init__(self)
+
+    def add(self, data):
+        self.client._delay()
+        with self.client.lock:
+            doc_id = f'{self.name}-{next(self.client.ids)}'
+            self.docs[doc_id] = dict(data)
+        return time.time(), FakeDocument(doc_id, data)
+
+
+class FakeFirestore:
+    """Thread-safe dict-backed client; `latency` seconds are slept per call."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.collections = {}
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name):
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = FakeCollection(self, name)
+            return self.collections[name]
@@ -0,0 +1,250 @@
+"""Open-loop HTTP load test with a synthetic mobile traffic mix.
+
+Starts benchmarks.serve_stubbed in a subprocess (or targets --url), replays a
+weighted mix of /analyze uploads (wav, and m4a when ffmpeg is available) and
+the JSON search endpoints at Poisson arrival rates, and steps the rate up until
+the server saturates.
+
+    python -m benchmarks.load_test --rates 0.5 1 2 4
+    python -m benchmarks.load_test --auto --start-rate 0.5 --step-seconds 30
+    python -m benchmarks.load_test --url http://10.0.0.5:5000 --rates 1 2
+
+Latency is measured from each request's scheduled arrival time, so client-side
+queueing at saturation is not hidden (no coordinated omission).
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import percentiles, write_json
+from benchmarks.synth import song, write_wav
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, weight) - roughly what the app sends: mostly 15 s recordings
+DEFAULT_MIX = {
+    'analyze_m4a_15s': 40,
+    'analyze_wav_15s': 15,
+    'analyze_wav_60s': 5,
+    'search_by_key': 20,
+    'search_artist': 10,
+    'get_chord_progressions': 10,
+}
+KEYS = ['A Minor', 'D Minor', 'E Minor', 'C Major', 'G Major']
+ARTISTS = ['Drake', 'Travis Scott', 'Post Malone']
+
+
+def build_uploads(directory):
+    """Synthetic recordings per upload type; m4a only if ffmpeg can encode it."""
+    uploads = {}
+    for duration in (15, 60):
+        wav = write_wav(os.path.join(directory, f'clip_{duration}s.wav'), song('E Minor', 128, duration, seed=duration))
+        uploads[f'analyze_wav_{duration}s'] = wav
+        if shutil.which('ffmpeg'):
+            m4a = os.path.join(directory, f'clip_{duration}s.m4a')
+            subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-i', wav, '-ac', '2', '-ar', '44100',
+                            '-c:a', 'aac', '-b:a', '128k', m4a], check=True)
+            uploads[f'analyze_m4a_{duration}s'] = m4a
+    return uploads
+
+
+def make_request(session, base_url, kind, uploads, rng):
+    if kind.startswith('analyze_'):
+        path = uploads[kind]
+        with open(path, 'rb') as f:
+            return session.post(f'{base_url}/analyze', files={'audio': (os.path.basename(path), f)}, timeout=120)
+    if kind == 'search_by_key':
+        return session.post(f'{base_url}/search_by_key', json={'key': rng.choice(KEYS), 'limit': 20}, timeout=60)
+    if kind == 'search_artist':
+        return session.post(f'{base_url}/search_artist', json={'artist': rng.choice(ARTISTS)}, timeout=60)
+    if kind == 'get_chord_progressions':
+        return session.post(f'{base_url}/get_chord_progressions', json={'key': rng.choice(KEYS)}, timeout=60)
+    raise ValueError(kind)
+
+
+def run_step(base_url, rate, seconds, mix, uploads, seed, max_workers):
+    """Offer `rate` requests/s for `seconds`; return per-endpoint and overall stats."""
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    local = threading.local()
+    lock = threading.Lock()
+    records = []
+
+    def fire(kind, scheduled):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        ok = False
+        try:
+            resp = make_request(local.session, base_url, kind, uploads, random.Random(scheduled))
+            body = resp.json() if resp.headers.get('Content-Type', '').startswith('application/json') else {}
+            ok = resp.status_code == 200 and 'error' not in body
+        except Exception:
+            pass
+        finished = time.perf_counter()
+        with lock:
+            records.append((kind, finished - scheduled, ok, finished))
+
+    started = time.perf_counter()
+    end = started + seconds
+    next_at = started
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            next_at += rng.expovariate(rate)
+            if next_at >= end:
+                break
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, rng.choices(kinds, weights)[0], next_at)
+    drained = time.perf_counter()
+
+    # Completions are spread over the window plus however long the backlog took to drain
+    elapsed = max(seconds, max((r[3] for r in records), default=end) - started)
+
+    def summarize(rows):
+        latencies = [r[1] for r in rows if r[2]]
+        return {
+            'requests': len(rows),
+            'arrival_rps': round(len(rows) / seconds, 3),
+            'errors': sum(1 for r in rows if not r[2]),
+            'error_rate': round(sum(1 for r in rows if not r[2]) / len(rows), 4) if rows else 0.0,
+            'throughput_rps': round(sum(1 for r in rows if r[2]) / elapsed, 3),
+            'latency': percentiles(latencies),
+        }
+
+    step = {'offered_rps': rate, 'seconds': seconds, 'drain_seconds': round(drained - end, 2),
+            'overall': summarize(records), 'endpoints': {}}
+    for kind in kinds:
+        rows = [r for r in records if r[0] == kind]
+        if rows:
+            step['endpoints'][kind] = summarize(rows)
+    return step
+
+
+def warm_up(base_url, mix, uploads):
+    """One request of each kind so JIT compilation and caches are not measured."""
+    session = requests.Session()
+    for kind in mix:
+        make_request(session, base_url, kind, uploads, random.Random(0))
+
+
+def is_saturated(step, baseline_p95, args):
+    overall = step['overall']
+    if not overall['requests']:
+        return False
+    p95 = overall['latency'].get('p95_ms')
+    return (overall['throughput_rps'] < args.throughput_ratio * overall['arrival_rps']
+            or overall['error_rate'] > args.max_error_rate
+            or (baseline_p95 and p95 and p95 > args.latency_factor * baseline_p95))
+
+
+def print_step(step):
+    o = step['overall']
+    lat = o['latency']
+    print(f"offered {step['offered_rps']:>6.2f} rps | done {o['throughput_rps']:>6.2f} rps | "
+          f"p50 {lat.get('p50_ms', 0):>8.1f} p95 {lat.get('p95_ms', 0):>8.1f} p99 {lat.get('p99_ms', 0):>8.1f} ms | "
+          f"errors {o['error_rate'] * 100:>5.1f}%")
+    for kind, e in step['endpoints'].items():
+        lat = e['latency']
+        print(f"    {kind:<24} n={e['requests']:<5} p50 {lat.get('p50_ms', 0):>8.1f} "
+              f"p95 {lat.get('p95_ms', 0):>8.1f} p99 {lat.get('p99_ms', 0):>8.1f} ms  errors {e['errors']}")
+
+
+def start_local_server(port, args):
+    cmd = [sys.executable, '-m', 'benchmarks.serve_stubbed', '--port', str(port), '--latency', args.latency,
+           '--error-rate', str(args.stub_error_rate), '--acr-qps', str(args.acr_qps)]
+    proc = subprocess.Popen(cmd, cwd=SERVER_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('stubbed server exited during startup')
+        try:
+            if requests.get(f'{base_url}/health', timeout=1).ok:
+                return proc, base_url
+        except requests.RequestException:
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError('stubbed server did not become healthy')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='target an already running server instead of starting one')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--rates', type=float, nargs='+', help='offered request rates (req/s) to test')
+    parser.add_argument('--auto', action='store_true', help='increase the rate until saturation')
+    parser.add_argument('--start-rate', type=float, default=0.5)
+    parser.add_argument('--growth', type=float, default=1.5)
+    parser.add_argument('--max-steps', type=int, default=12)
+    parser.add_argument('--step-seconds', type=float, default=20)
+    parser.add_argument('--max-workers', type=int, default=256)
+    parser.add_argument('--throughput-ratio', type=float, default=0.9,
+                        help='saturated when completed/arrived falls below this')
+    parser.add_argument('--latency-factor', type=float, default=3.0,
+                        help='saturated when p95 exceeds this multiple of the first step')
+    parser.add_argument('--max-error-rate', type=float, default=0.05)
+    parser.add_argument('--latency', default='lognormal:0.3:0.4', help='stub ACRCloud latency distribution')
+    parser.add_argument('--stub-error-rate', type=float, default=0.0)
+    parser.add_argument('--acr-qps', type=float, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    if not args.rates and not args.auto:
+        args.auto = True
+
+    proc = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        proc, base_url = start_local_server(args.port, args)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            uploads = build_uploads(tmp)
+            mix = {k: w for k, w in DEFAULT_MIX.items() if not k.startswith('analyze_') or k in uploads}
+            skipped = sorted(set(DEFAULT_MIX) - set(mix))
+            if skipped:
+                print(f'ffmpeg not found, skipping: {", ".join(skipped)}')
+
+            warm_up(base_url, mix, uploads)
+            rates = args.rates or [args.start_rate * args.growth ** i for i in range(args.max_steps)]
+            steps, knee, baseline_p95 = [], None, None
+            for i, rate in enumerate(rates):
+                step = run_step(base_url, rate, args.step_seconds, mix, uploads, args.seed + i, args.max_workers)
+                print_step(step)
+                steps.append(step)
+                if baseline_p95 is None:
+                    baseline_p95 = step['overall']['latency'].get('p95_ms')
+                if is_saturated(step, baseline_p95, args):
+                    step['saturated'] = True
+                    knee = steps[-2]['offered_rps'] if len(steps) > 1 else None
+                    if args.auto:
+                        break
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    if knee is not None:
+        print(f'\nSaturation knee: ~{knee:.2f} req/s (next step at {steps[-1]["offered_rps"]:.2f} req/s saturated)')
+    elif steps and steps[-1].get('saturated'):
+        print('\nSaturated at the first step; lower --start-rate')
+    else:
+        print('\nNo saturation observed; raise the rates')
+    if args.output:
+        write_json(args.output, {'mix': mix, 'knee_rps': knee, 'steps': steps})
+
+
+if __name__ == '__main__':
+    main()
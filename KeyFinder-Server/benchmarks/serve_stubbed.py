@@ -0,0 +1,38 @@
+"""Run the real Flask app over HTTP with ACRCloud and Firestore stubbed out.
+
+    python -m benchmarks.serve_stubbed --port 5050 --latency lognormal:0.3:0.4
+"""
+import argparse
+
+from werkzeug.serving import make_server
+
+from benchmarks.stack import start_stub_stack
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--latency', default='lognormal:0.3:0.4', help='stub ACRCloud latency distribution')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--no-match-rate', type=float, default=0.1)
+    parser.add_argument('--firestore-latency', type=float, default=0.02)
+    parser.add_argument('--acr-qps', type=float, default=1000)
+    args = parser.parse_args()
+
+    server, stub, _ = start_stub_stack(args.latency, args.error_rate, 0.0, args.no_match_rate,
+                                       args.firestore_latency, args.acr_qps)
+    # Seed the fake Firestore so /search_by_key exercises the query path
+    for key in server.CHORD_PROGRESSIONS:
+        server.db.collection('audio_analyses').add({'key': key, 'bpm': 120, 'status': 'recognized',
+                                                    'title': f'Stub {key}', 'artist': 'Stub Artist'})
+    http = make_server(args.host, args.port, server.app, threaded=True)
+    print(f'Stubbed KeyFinder server on http://{args.host}:{args.port} (ACRCloud stub {stub.address})', flush=True)
+    try:
+        http.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Boot server.py in-process against the local ACRCloud and Firestore stand-ins."""
+import importlib
+import os
+import sys
+
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.stub_acrcloud import StubIdentifyServer
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_DIR = os.path.join(SERVER_DIR, 'benchmarks', 'stubs')
+
+
+def start_stub_stack(latency='lognormal:0.3:0.4', error_rate=0.0, qps_limit_rate=0.0, no_match_rate=0.0,
+                     firestore_latency=0.0, acr_qps=1000, seed=0):
+    """Start the stub identify server and import `server` wired to it.
+
+    Returns (server_module, stub_identify_server, fake_firestore).
+    """
+    stub = StubIdentifyServer(('127.0.0.1', 0), latency=latency, error_rate=error_rate,
+                              qps_limit_rate=qps_limit_rate, no_match_rate=no_match_rate, seed=seed)
+    stub.start_background()
+
+    os.environ.update({
+        'ACRCLOUD_HOST': stub.address,
+        'ACRCLOUD_PROTOCOL': 'http',
+        'ACRCLOUD_ACCESS_KEY': stub.access_key,
+        'ACRCLOUD_ACCESS_SECRET': stub.access_secret,
+        'ACRCLOUD_QPS': str(acr_qps),
+        'ACRCLOUD_BURST': str(max(1, int(acr_qps))),
+    })
+    os.environ.pop('GOOGLE_APPLICATION_CREDENTIALS', None)
+    # Benchmarks replay the same clips; measure the analysis, not result cache hits
+    os.environ.setdefault('RESULT_CACHE_ENTRIES', '0')
+    # One in-process server: keep the ACRCloud rate limit private instead of writing acr_state/
+    os.environ.setdefault('ACRCLOUD_STATE_DIR', '')
+    for path in (STUBS_DIR, SERVER_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    server = sys.modules.get('server') or importlib.import_module('server')
+    server.acr.host = stub.address
+    server.acr.protocol = 'http'
+    server.acr.access_key = stub.access_key
+    server.acr.access_secret = stub.access_secret
+
+    firestore = FakeFirestore(latency=firestore_latency)
+    server.db = firestore
+    return server, stub, firestore
@@ -0,0 +1,203 @@
+"""Local stand-in for the ACRCloud /v1/identify endpoint.
+
+Speaks the same signed multipart protocol as ACRCloudRecognizer.do_recogize,
+with configurable latency, error rates and canned track metadata.
+
+    python -m benchmarks.stub_acrcloud --port 8089 --latency lognormal:0.4:0.5 --error-rate 0.02
+
+Point the server at it with ACRCLOUD_HOST=127.0.0.1:8089 ACRCLOUD_PROTOCOL=http.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_TRACKS = [
+    {'title': 'Sicko Mode', 'artists': ['Travis Scott'], 'album': 'Astroworld', 'release_date': '2018-08-03'},
+    {'title': "God's Plan", 'artists': ['Drake'], 'album': 'Scorpion', 'release_date': '2018-01-19'},
+    {'title': 'Circles', 'artists': ['Post Malone'], 'album': "Hollywood's Bleeding", 'release_date': '2019-08-30'},
+    {'title': 'Shape of You', 'artists': ['Ed Sheeran'], 'album': '÷', 'release_date': '2017-01-06'},
+]
+
+
+class LatencyModel:
+    """Parses 'fixed:S', 'uniform:LO:HI', 'normal:MEAN:STD' or 'lognormal:MEDIAN:SIGMA' (seconds)."""
+
+    def __init__(self, spec='fixed:0', seed=None):
+        kind, *params = spec.split(':')
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f'unknown latency distribution: {spec}')
+
+    def sample(self):
+        with self.lock:
+            p = self.params
+            if self.kind == 'fixed':
+                value = p[0] if p else 0.0
+            elif self.kind == 'uniform':
+                value = self.rng.uniform(p[0], p[1])
+            elif self.kind == 'normal':
+                value = self.rng.gauss(p[0], p[1])
+            else:
+                value = self.rng.lognormvariate(0, p[1]) * p[0]
+        return max(0.0, value)
+
+
+def parse_multipart(body, content_type):
+    """Minimal multipart/form-data parser returning {name: bytes}."""
+    boundary = content_type.split('boundary=', 1)[1].strip().strip('"').encode('ascii')
+    parts = {}
+    for chunk in body.split(b'--' + boundary):
+        chunk = chunk.strip(b'\r\n')
+        if not chunk or chunk == b'--':
+            continue
+        head, _, value = chunk.partition(b'\r\n\r\n')
+        for line in head.split(b'\r\n'):
+            if line.lower().startswith(b'content-disposition'):
+                name = line.split(b'name="', 1)[1].split(b'"', 1)[0].decode('utf-8')
+                parts[name] = value
+    return parts
+
+
+def sign(access_secret, access_key, data_type, signature_version, timestamp, endpoint='/v1/identify'):
+    string_to_sign = '\n'.join(['POST', endpoint, access_key, data_type, signature_version, timestamp])
+    digest = hmac.new(access_secret.encode('ascii'), string_to_sign.encode('ascii'), digestmod=hashlib.sha1).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def status(code, msg):
+    return {'status': {'msg': msg, 'code': code, 'version': '1.0'}}
+
+
+def track_payload(track):
+    return {
+        'title': track['title'],
+        'artists': [{'name': a} for a in track['artists']],
+        'album': {'name': track['album']},
+        'release_date': track['release_date'],
+        'external_metadata': {'spotify': [{'track': {'id': 'stub'}}]},
+        'score': 100,
+    }
+
+
+class StubIdentifyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, access_key='bench-key', access_secret='bench-secret', latency='fixed:0',
+                 error_rate=0.0, qps_limit_rate=0.0, no_match_rate=0.0, tracks=None, seed=None):
+        super().__init__(address, IdentifyHandler)
+        self.access_key = access_key
+        self.access_secret = access_secret
+        self.latency = LatencyModel(latency, seed)
+        self.error_rate = error_rate
+        self.qps_limit_rate = qps_limit_rate
+        self.no_match_rate = no_match_rate
+        self.tracks = tracks or CANNED_TRACKS
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def roll(self):
+        with self.lock:
+            self.requests += 1
+            return self.rng.random()
+
+    def start_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def address(self):
+        host, port = self.server_address[:2]
+        return f'{host}:{port}'
+
+
+class IdentifyHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, payload, code=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        started = time.monotonic()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/v1/identify':
+            return self._reply(status(3000, 'Not Found'), 404)
+
+        try:
+            fields = parse_multipart(body, self.headers.get('Content-Type', ''))
+            form = {k: v.decode('utf-8') for k, v in fields.items() if k not in ('sample', 'sample_hum')}
+        except Exception as e:
+            return self._reply(status(3006, f'Invalid arguments: {e}'))
+
+        if form.get('access_key') != server.access_key:
+            return self._reply(status(3001, 'Missing/Invalid Access Key'))
+        expected = sign(server.access_secret, server.access_key, form.get('data_type', ''),
+                        form.get('signature_version', ''), form.get('timestamp', ''))
+        if not hmac.compare_digest(expected, form.get('signature', '')):
+            return self._reply(status(3014, 'Invalid signature'))
+        sample = fields.get('sample', b'')
+        if str(len(sample)) != form.get('sample_bytes'):
+            return self._reply(status(3006, 'Invalid arguments: sample_bytes mismatch'))
+
+        time.sleep(server.latency.sample())
+        roll = server.roll()
+        if roll < server.error_rate:
+            return self._reply({'error': 'stub internal error'}, 500)
+        roll -= server.error_rate
+        if roll < server.qps_limit_rate:
+            return self._reply(status(3015, 'QpS limit exceeded'))
+        roll -= server.qps_limit_rate
+        if roll < server.no_match_rate:
+            return self._reply(status(1001, 'No result'))
+
+        track = server.tracks[int.from_bytes(hashlib.sha1(sample).digest()[:4], 'big') % len(server.tracks)]
+        payload = status(0, 'Success')
+        payload['metadata'] = {'music': [track_payload(track)]}
+        payload['cost_time'] = round(time.monotonic() - started, 3)
+        payload['result_type'] = 0
+        self._reply(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--access-key', default='bench-key')
+    parser.add_argument('--access-secret', default='bench-secret')
+    parser.add_argument('--latency', default='lognormal:0.3:0.4')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--qps-limit-rate', type=float, default=0.0)
+    parser.add_argument('--no-match-rate', type=float, default=0.0)
+    parser.add_argument('--tracks', help='JSON file with a list of canned tracks')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    tracks = None
+    if args.tracks:
+        with open(args.tracks) as f:
+            tracks = json.load(f)
+    server = StubIdentifyServer((args.host, args.port), args.access_key, args.access_secret, args.latency,
+                                args.error_rate, args.qps_limit_rate, args.no_match_rate, tracks, args.seed)
+    print(f'Stub ACRCloud identify server on http://{server.address}/v1/identify')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
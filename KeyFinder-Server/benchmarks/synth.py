@@ -0,0 +1,76 @@
+import numpy as np
+import soundfile as sf
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# I - vi - IV - V in major, i - VI - III - VII in minor (scale degrees in semitones)
+MAJOR_PROGRESSION = [(0, 4, 7), (9, 12, 16), (5, 9, 12), (7, 11, 14)]
+MINOR_PROGRESSION = [(0, 3, 7), (8, 12, 15), (3, 7, 10), (10, 14, 17)]
+
+
+def _midi_to_hz(midi):
+    return 440.0 * 2 ** ((midi - 69) / 12.0)
+
+
+def chord_progression(key, duration, sr=22050, bpm=120, seed=0):
+    """Deterministic four-chord loop in `key` (e.g. 'A Minor'), one chord per bar."""
+    root_name, mode = key.split()
+    root = 48 + NOTE_NAMES.index(root_name)
+    progression = MAJOR_PROGRESSION if mode == 'Major' else MINOR_PROGRESSION
+    rng = np.random.default_rng(seed)
+
+    n = int(duration * sr)
+    t = np.arange(n) / sr
+    bar = 4 * 60.0 / bpm
+    y = np.zeros(n, dtype=np.float32)
+    for start in np.arange(0, duration, bar):
+        chord = progression[int(start / bar) % len(progression)]
+        i0, i1 = int(start * sr), min(n, int((start + bar) * sr))
+        seg = t[i0:i1] - start
+        env = np.exp(-seg * 1.5)
+        for interval in chord + (chord[0] - 12,):
+            f = _midi_to_hz(root + interval)
+            phase = rng.uniform(0, 2 * np.pi)
+            for h, amp in ((1, 1.0), (2, 0.4), (3, 0.2)):
+                y[i0:i1] += (amp * env * np.sin(2 * np.pi * f * h * seg + phase)).astype(np.float32)
+    return 0.2 * y / (np.max(np.abs(y)) + 1e-9)
+
+
+def click_track(bpm, duration, sr=22050):
+    """Short decaying noise bursts on every beat."""
+    n = int(duration * sr)
+    y = np.zeros(n, dtype=np.float32)
+    click_len = int(0.03 * sr)
+    click = np.random.default_rng(1).standard_normal(click_len).astype(np.float32)
+    click *= np.exp(-np.linspace(0, 8, click_len)).astype(np.float32)
+    for beat in np.arange(0, duration, 60.0 / bpm):
+        i0 = int(beat * sr)
+        i1 = min(n, i0 + click_len)
+        y[i0:i1] += click[:i1 - i0]
+    return 0.5 * y
+
+
+def song(key, bpm, duration, sr=22050, seed=0):
+    """Chord loop plus click track: a clip with a known key and tempo."""
+    return chord_progression(key, duration, sr, bpm, seed) + click_track(bpm, duration, sr)
+
+
+def write_wav(path, y, sr=22050):
+    sf.write(path, y, sr, subtype='PCM_16')
+    return path
+
+
+def noise(duration, sr=22050, level=0.1, seed=0):
+    """White noise: no key, no tempo."""
+    return (level * np.random.default_rng(seed).standard_normal(int(duration * sr))).astype(np.float32)
+
+
+def silence(duration, sr=22050):
+    return np.zeros(int(duration * sr), dtype=np.float32)
+
+
+def to_upload_format(y, sr=22050, target_sr=44100):
+    """Resample to a typical phone recording rate and duplicate to stereo."""
+    idx = np.arange(int(len(y) * target_sr / sr)) * (sr / target_sr)
+    up = np.interp(idx, np.arange(len(y)), y).astype(np.float32)
+    return np.stack([up, up], axis=1), target_sr
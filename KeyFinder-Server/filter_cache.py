@@ -0,0 +1,107 @@
+import os
+import threading
+
+import librosa
+import numpy as np
+from librosa.core import constantq
+
+# --- Configuration ---
+FILTER_CACHE = os.getenv('FILTER_CACHE', '1') == '1'
+FILTER_CACHE_MAX_ENTRIES = int(os.getenv('FILTER_CACHE_MAX_ENTRIES', 1024))
+
+# librosa rebuilds the constant-Q basis (one FFT'd wavelet bank per octave) and
+# the CQT-to-chroma map on every chroma_cqt call. Both depend only on the
+# analysis parameters (sample rate, hop, tuning ...), so they are memoized here
+# for the life of the process.
+_BASIS_FUNCTION = '__vqt_filter_fft'
+
+_lock = threading.Lock()
+_bases = {}
+_chroma_maps = {}
+_stats = {'hits': 0, 'misses': 0}
+_originals = {}
+
+
+def _freeze(value):
+    """Hashable form of a filter parameter (arrays are keyed by dtype, shape and bytes)."""
+    if isinstance(value, np.ndarray):
+        return ('ndarray', value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, type):
+        return value.__name__
+    if isinstance(value, np.dtype):
+        return value.str
+    return value
+
+
+def _key(args, kwargs):
+    return tuple(_freeze(a) for a in args) + tuple(sorted((k, _freeze(v)) for k, v in kwargs.items()))
+
+
+def _evict(cache):
+    """Drop the oldest entries once the cache is full (callers hold _lock)."""
+    while len(cache) >= FILTER_CACHE_MAX_ENTRIES:
+        cache.pop(next(iter(cache)))
+
+
+def _cached_basis(*args, **kwargs):
+    key = _key(args, kwargs)
+    with _lock:
+        entry = _bases.get(key)
+        _stats['hits' if entry else 'misses'] += 1
+    if entry is None:
+        entry = _originals['basis'](*args, **kwargs)
+        with _lock:
+            _evict(_bases)
+            entry = _bases.setdefault(key, entry)
+    fft_basis, n_fft, lengths = entry
+    # librosa rescales the basis in place after early downsampling
+    return fft_basis.copy(), n_fft, lengths
+
+
+def _cached_chroma_map(*args, **kwargs):
+    key = _key(args, kwargs)
+    with _lock:
+        chroma_map = _chroma_maps.get(key)
+        _stats['hits' if chroma_map is not None else 'misses'] += 1
+    if chroma_map is None:
+        chroma_map = _originals['chroma_map'](*args, **kwargs)
+        chroma_map.setflags(write=False)
+        with _lock:
+            _evict(_chroma_maps)
+            chroma_map = _chroma_maps.setdefault(key, chroma_map)
+    return chroma_map
+
+
+def install():
+    """Route librosa's CQT basis and chroma-map construction through the cache (idempotent)."""
+    if not FILTER_CACHE or _originals:
+        return
+    _originals['basis'] = getattr(constantq, _BASIS_FUNCTION)
+    _originals['chroma_map'] = librosa.filters.cq_to_chroma
+    # Both are looked up as module attributes at call time, so rebinding them is enough
+    setattr(constantq, _BASIS_FUNCTION, _cached_basis)
+    librosa.filters.cq_to_chroma = _cached_chroma_map
+
+
+def warm(configurations, tunings=(0.0,), duration=3.0):
+    """Build the filters for each (sr, hop_length) and tuning up front.
+
+    Call before the server forks so workers share the arrays copy-on-write.
+    """
+    if not _originals:
+        return
+    for sr, hop_length in configurations:
+        y = np.zeros(int(duration * sr), dtype=np.float32)
+        for tuning in tunings:
+            librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=hop_length, tuning=tuning)
+
+
+def stats():
+    with _lock:
+        nbytes = sum(basis.data.nbytes + basis.indices.nbytes + basis.indptr.nbytes
+                     for basis, _, _ in _bases.values())
+        nbytes += sum(m.nbytes for m in _chroma_maps.values())
+        return {'enabled': bool(_originals), 'bases': len(_bases), 'chroma_maps': len(_chroma_maps),
+                'bytes': nbytes, **_stats}
@@ -0,0 +1,140 @@
+import os
+import resource
+import signal
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from flask import request
+
+import metrics
+
+# --- Configuration ---
+MEMORY_BUDGET_MB = float(os.getenv('MEMORY_BUDGET_MB', 1536))
+WORKER_MAX_RSS_MB = float(os.getenv('WORKER_MAX_RSS_MB', 0))  # 0 disables recycling
+# tracemalloc slows allocation-heavy DSP by more than half, so peak tracking is opt-in
+MEMORY_TRACKING = os.getenv('MEMORY_TRACKING', '0') == '1'
+
+# Peak traced allocation per second of input audio for decode + trim + tempo + chroma_cqt
+# at 22.05 kHz, measured with tracemalloc (CQT dominates at ~1.4 MB/s).
+ANALYSIS_BYTES_PER_SECOND = 1_500_000
+# Lowest bitrate assumed when the header gives no duration (64 kbit/s), which bounds the
+# audio a file of a given size can hold
+MIN_AUDIO_BYTES_PER_SECOND = int(os.getenv('MIN_AUDIO_BYTES_PER_SECOND', 8000))
+
+MB = 1024 * 1024
+
+ANALYSIS_PEAK_BYTES = metrics.Histogram(
+    'keyfinder_analysis_peak_bytes', 'Peak traced allocation per audio analysis.',
+    buckets=tuple(mb * MB for mb in (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)))
+BUDGET_REJECTIONS = metrics.Counter('keyfinder_memory_budget_rejections_total',
+                                    'Uploads rejected because their estimated memory exceeded the budget.')
+WORKER_RECYCLES = metrics.Counter('keyfinder_worker_recycles_total',
+                                  'Workers asked to exit after exceeding WORKER_MAX_RSS_MB.')
+
+_tracking_lock = threading.Lock()
+_active_tracked = 0
+_started_tracing = False
+
+
+def current_rss_bytes():
+    """Resident set size of this process (falls back to the peak RSS off Linux)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def estimate_analysis_bytes(duration_seconds):
+    return int(duration_seconds * ANALYSIS_BYTES_PER_SECOND)
+
+
+def check_budget(duration_seconds, file_size=None):
+    """Return an error message if analyzing this much audio would exceed the budget.
+
+    Without a duration, `file_size` bounds it at MIN_AUDIO_BYTES_PER_SECOND.
+    """
+    if MEMORY_BUDGET_MB <= 0:
+        return None
+    if not duration_seconds:
+        if not file_size:
+            return None
+        if estimate_analysis_bytes(file_size / MIN_AUDIO_BYTES_PER_SECOND) <= MEMORY_BUDGET_MB * MB:
+            return None
+        BUDGET_REJECTIONS.inc()
+        max_mb = MEMORY_BUDGET_MB * MIN_AUDIO_BYTES_PER_SECOND / ANALYSIS_BYTES_PER_SECOND
+        return (f"Audio of unknown duration too large to analyze ({file_size / MB:.1f} MB); "
+                f"the maximum is {max_mb:.1f} MB")
+    estimate = estimate_analysis_bytes(duration_seconds)
+    if estimate <= MEMORY_BUDGET_MB * MB:
+        return None
+    BUDGET_REJECTIONS.inc()
+    max_minutes = MEMORY_BUDGET_MB * MB / ANALYSIS_BYTES_PER_SECOND / 60
+    return (f"Audio too long to analyze ({duration_seconds / 60:.1f} min); "
+            f"the maximum is {max_minutes:.1f} min")
+
+
+@contextmanager
+def track_peak():
+    """Record peak traced allocation for the enclosed analysis.
+
+    tracemalloc is process-wide, so when analyses overlap the recorded peak is
+    an upper bound for each of them. Tracing runs only while a tracked
+    analysis is in flight.
+    """
+    global _active_tracked, _started_tracing
+    stats = {'peak_bytes': None}
+    if not MEMORY_TRACKING:
+        yield stats
+        return
+
+    with _tracking_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+            _started_tracing = True
+        if _active_tracked == 0:
+            tracemalloc.reset_peak()
+        _active_tracked += 1
+        baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        yield stats
+    finally:
+        with _tracking_lock:
+            peak = tracemalloc.get_traced_memory()[1]
+            _active_tracked -= 1
+            if _active_tracked == 0 and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+        stats['peak_bytes'] = max(0, peak - baseline)
+        ANALYSIS_PEAK_BYTES.observe(stats['peak_bytes'])
+
+
+def _recycle_worker():
+    print(f"Worker RSS above {WORKER_MAX_RSS_MB:.0f} MB, exiting for recycling")
+    WORKER_RECYCLES.inc()
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def init_app(app):
+    """Ask a pre-fork worker to exit gracefully once its RSS creeps past WORKER_MAX_RSS_MB."""
+
+    @app.after_request
+    def _check_rss(response):
+        if WORKER_MAX_RSS_MB <= 0 or current_rss_bytes() < WORKER_MAX_RSS_MB * MB:
+            return response
+        if request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+            # SIGTERM makes gunicorn finish in-flight requests and fork a fresh worker
+            response.call_on_close(_recycle_worker)
+        else:
+            print(f"Worker RSS above {WORKER_MAX_RSS_MB:.0f} MB; recycling needs a pre-fork server (gunicorn)")
+        return response
+
+    @metrics.register_collector
+    def _memory_metrics():
+        return ['# HELP keyfinder_process_rss_bytes Resident set size of this worker.',
+                '# TYPE keyfinder_process_rss_bytes gauge',
+                f'keyfinder_process_rss_bytes {current_rss_bytes()}',
+                '# HELP keyfinder_memory_budget_bytes Per-analysis memory budget.',
+                '# TYPE keyfinder_memory_budget_bytes gauge',
+                f'keyfinder_memory_budget_bytes {int(MEMORY_BUDGET_MB * MB)}']
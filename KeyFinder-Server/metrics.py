@@ -0,0 +1,163 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}'
+                                for k, v in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.series.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.series[key] = (counts, total + value)
+
+    def render(self):
+        with self.lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self.series.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, {'le': _format_value(bound)})
+                lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {counts[-1]}')
+        return lines
+
+
+REGISTRY = []
+COLLECTORS = []
+
+STAGE_SECONDS = Histogram('keyfinder_stage_duration_seconds',
+                          'Time spent in each analysis and backend stage.', ['stage'])
+REQUEST_SECONDS = Histogram('keyfinder_request_duration_seconds',
+                            'End-to-end HTTP request latency.', ['endpoint', 'method', 'status'])
+
+
+def register_collector(fn):
+    """Add a callable returning extra exposition lines, rendered on every scrape."""
+    COLLECTORS.append(fn)
+    return fn
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collector in COLLECTORS:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            print(f"Metrics collector error: {e}")
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def stage(name):
+    """Time a block with a monotonic clock and record it as `name`.
+
+    Inside a request the duration is also reported in the Server-Timing header.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        if has_request_context() and hasattr(g, 'stage_timings'):
+            g.stage_timings.append((name, elapsed))
+
+
+def init_app(app):
+    """Install request timing hooks and the Server-Timing response header."""
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        g.stage_timings = []
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+        entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in g.get('stage_timings', [])]
+        entries.append(f'total;dur={elapsed * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(entries)
+        return response
@@ -0,0 +1,226 @@
+import cProfile
+import fcntl
+import functools
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, make_response, request
+
+import metrics
+
+# --- Configuration ---
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_ENTRIES = int(os.getenv('PROFILE_MAX_ENTRIES', 50))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sampling')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+
+MODES = ('sampling', 'deterministic')
+EXTENSIONS = {'sampling': '.folded', 'deterministic': '.pstats'}
+
+PROFILES_CAPTURED = metrics.Counter('keyfinder_profiles_captured_total',
+                                    'Requests captured by the on-demand profiler.', ['mode', 'trigger'])
+
+
+def authorized(req):
+    """True if the request carries `Authorization: Bearer <ADMIN_TOKEN>`."""
+    if not ADMIN_TOKEN:
+        return False
+    header = req.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(header[len('Bearer '):].encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+
+class SamplingProfiler:
+    """Periodically samples one thread's Python stack into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def dump(self, path):
+        """Write flamegraph.pl / speedscope compatible collapsed stacks."""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+@contextmanager
+def _index_lock(exclusive=True):
+    """Lock the profile index across worker processes.
+
+    index.json is replaced on every write, so the flock is taken on a separate file.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, 'index.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def _load_index():
+    path = os.path.join(PROFILE_DIR, 'index.json')
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_index(entries):
+    path = os.path.join(PROFILE_DIR, 'index.json')
+    tmp = f'{path}.{uuid.uuid4().hex[:8]}'
+    with open(tmp, 'w') as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _record(entry):
+    """Append to the on-disk ring, deleting the oldest profiles beyond PROFILE_MAX_ENTRIES."""
+    with _index_lock():
+        entries = _load_index()
+        entries.append(entry)
+        while len(entries) > PROFILE_MAX_ENTRIES:
+            old = entries.pop(0)
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old['file']))
+            except OSError:
+                pass
+        _save_index(entries)
+
+
+def list_profiles(audio_hash=None):
+    with _index_lock(exclusive=False):
+        entries = _load_index()
+    if audio_hash:
+        entries = [e for e in entries if e.get('audio_sha256') == audio_hash]
+    return list(reversed(entries))
+
+
+def find_profile(request_id):
+    """Return (entry, absolute path) for a stored profile, or (None, None)."""
+    for entry in list_profiles():
+        if entry['request_id'] == request_id:
+            return entry, os.path.abspath(os.path.join(PROFILE_DIR, entry['file']))
+    return None, None
+
+
+def _trigger():
+    """Decide whether this request is profiled: explicit opt-in or random sampling."""
+    if request.headers.get('X-Profile') and authorized(request):
+        return 'header'
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return 'sampled'
+    return None
+
+
+def profiled(view):
+    """Wrap a Flask view so opted-in or sampled requests are profiled."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        trigger = _trigger()
+        if trigger is None:
+            return view(*args, **kwargs)
+
+        mode = request.headers.get('X-Profile-Mode', PROFILE_MODE)
+        if mode not in MODES:
+            mode = PROFILE_MODE
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        request_id = ''.join(c for c in request_id if c.isalnum() or c in '-_')[:64] or uuid.uuid4().hex
+
+        started = time.perf_counter()
+        if mode == 'deterministic':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = SamplingProfiler(threading.get_ident())
+            profiler.start()
+
+        def finish(entry):
+            if mode == 'deterministic':
+                profiler.disable()
+            else:
+                profiler.stop()
+            entry['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            try:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                filename = f'{request_id}_{uuid.uuid4().hex[:8]}{EXTENSIONS[mode]}'
+                if mode == 'deterministic':
+                    profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+                else:
+                    profiler.dump(os.path.join(PROFILE_DIR, filename))
+                entry['file'] = filename
+                _record(entry)
+                PROFILES_CAPTURED.inc(mode=mode, trigger=trigger)
+            except Exception as e:
+                print(f"Profile save error: {e}")
+
+        def entry():
+            return {
+                'request_id': request_id,
+                # Set by views that hash the upload while receiving it
+                'audio_sha256': g.get('audio_sha256'),
+                'endpoint': request.endpoint,
+                'mode': mode,
+                'trigger': trigger,
+                'created': datetime.now().isoformat(),
+            }
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            finish(entry())
+            raise
+        response.headers['X-Profile-Id'] = request_id
+        if not response.is_streamed:
+            finish(entry())
+            return response
+
+        # A streamed (SSE) response does its work while the body is sent, after
+        # the view has returned: keep profiling until the stream ends or is closed
+        streamed_entry = entry()
+        body = response.response
+
+        def profiled_body():
+            try:
+                yield from body
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+                finish(streamed_entry)
+
+        response.response = profiled_body()
+        return response
+
+    return wrapper
@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# --- Configuration ---
+RESULT_CACHE_ENTRIES = int(os.getenv('RESULT_CACHE_ENTRIES', 512))  # 0 disables the cache
+RESULT_CACHE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', 24 * 3600))
+
+RESULT_CACHE_LOOKUPS = metrics.Counter('keyfinder_result_cache_lookups_total',
+                                       'Analysis result cache lookups by content hash.', ['result'])
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+
+
+def cache_key(sha256, **options):
+    """Key for an upload's result: its content hash plus the options that change the answer."""
+    return (sha256,) + tuple(sorted((name, repr(value)) for name, value in options.items()))
+
+
+def get(key):
+    """The cached result for `key`, or None (expired entries count as misses)."""
+    if RESULT_CACHE_ENTRIES <= 0:
+        return None
+    with _lock:
+        entry = _entries.get(key)
+        if entry and time.time() - entry[0] > RESULT_CACHE_TTL_SECONDS:
+            del _entries[key]
+            entry = None
+        if entry:
+            _entries.move_to_end(key)
+    RESULT_CACHE_LOOKUPS.inc(result='hit' if entry else 'miss')
+    return dict(entry[1]) if entry else None
+
+
+def put(key, result):
+    if RESULT_CACHE_ENTRIES <= 0:
+        return
+    with _lock:
+        _entries[key] = (time.time(), dict(result))
+        _entries.move_to_end(key)
+        while len(_entries) > RESULT_CACHE_ENTRIES:
+            _entries.popitem(last=False)
@@ -1,7 +1,8 @@
 import os
 import json
 import traceback
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
+from werkzeug.http import parse_content_range_header
 import requests
 import firebase_admin
 from firebase_admin import credentials, firestore
@@ -13,10 +14,28 @@ from datetime import datetime, timedelta
 import hashlib
 import base64
 import hmac
-import time
 from acrcloud.recognizer import ACRCloudRecognizer
+from acr_scheduler import ACRCloudScheduler, SchedulerRejected, PRIORITY_INTERACTIVE
+from audio_analysis import (ADAPTIVE_MIN_CONFIDENCE, ANALYSIS_SR, QUALITY_MODES, QUALITY_PRESETS, StreamingAnalyzer,
+                            analyze_blocks, analyze_key, clip_statistics, decode_sample_rate, detect_key,
+                            estimate_from_statistics, estimate_tuning, frame_features, key_timeline, plan_segments,
+                            tempo_hop_length, tempo_with_statistics, tuning_cents, tuning_grid)
+import admission
+import analysis_sessions
+import audio_io
+import filter_cache
+import memory_guard
+import metrics
+import profiling
+import result_cache
+import uploads
 from dotenv import load_dotenv
 
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
 # Load environment variables from .env file
 load_dotenv() 
 
@@ -41,7 +60,8 @@ except Exception as e:
 # --- API Configurations ---
 # --- API Configurations ---
 ACRCLOUD_CONFIG = {
-    'host': 'identify-us-west-2.acrcloud.com',
+    'host': os.getenv('ACRCLOUD_HOST', 'identify-us-west-2.acrcloud.com'),
+    'protocol': os.getenv('ACRCLOUD_PROTOCOL', 'https'),
     'access_key': os.getenv('ACRCLOUD_ACCESS_KEY'),
     'access_secret': os.getenv('ACRCLOUD_ACCESS_SECRET'),
     'timeout': 10
@@ -51,6 +71,28 @@ GENIUS_ACCESS_TOKEN = os.getenv('GENIUS_ACCESS_TOKEN')
 # Initialize ACRCloud recognizer
 acr = ACRCloudRecognizer(ACRCLOUD_CONFIG)
 
+# Every ACRCloud call goes through the scheduler so bursts stay within the project quota.
+# ACRCLOUD_QPS and ACRCLOUD_DAILY_LIMIT are for the whole server: the token bucket and
+# daily count are shared by all worker processes through files in ACRCLOUD_STATE_DIR
+# (set it to an empty string for per-process limits).
+ACRCLOUD_DEADLINE_SECONDS = float(os.getenv('ACRCLOUD_DEADLINE_SECONDS', 15))
+acr_scheduler = ACRCloudScheduler(
+    qps=float(os.getenv('ACRCLOUD_QPS', 1)),
+    burst=int(os.getenv('ACRCLOUD_BURST', 2)),
+    daily_limit=int(os.getenv('ACRCLOUD_DAILY_LIMIT', 0)),
+    max_queue=int(os.getenv('ACRCLOUD_QUEUE_SIZE', 32)),
+    workers=int(os.getenv('ACRCLOUD_WORKERS', 2)),
+    state_dir=os.getenv('ACRCLOUD_STATE_DIR', 'acr_state') or None
+)
+
+# Analysis quality: 'fast', 'balanced', 'accurate' or 'adaptive' (cheap pass, refine if ambiguous)
+ANALYSIS_QUALITY = os.getenv('ANALYSIS_QUALITY', 'adaptive')
+if ANALYSIS_QUALITY not in QUALITY_MODES:
+    raise ValueError(f"ANALYSIS_QUALITY must be one of {', '.join(QUALITY_MODES)}")
+# Full-track analysis of recordings longer than this reads the file in blocks with bounded memory
+STREAM_ANALYSIS_SECONDS = float(os.getenv('STREAM_ANALYSIS_SECONDS', 600))
+STREAM_BLOCK_SECONDS = float(os.getenv('STREAM_BLOCK_SECONDS', 30))
+
 # Initialize Genius Client
 try:
     genius = lyricsgenius.Genius(GENIUS_ACCESS_TOKEN, verbose=False, timeout=20)
@@ -64,11 +106,17 @@ UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Backstop for every endpoint; /analyze enforces MAX_UPLOAD_MB itself while the body streams in
+app.config['MAX_CONTENT_LENGTH'] = uploads.max_upload_bytes() + uploads.MB
+upload_sessions = uploads.UploadSessions(os.path.join(UPLOAD_FOLDER, 'sessions'))
+session_store = analysis_sessions.AnalysisSessions(os.path.join(UPLOAD_FOLDER, 'analysis_sessions'))
+metrics.init_app(app)
+sock = Sock(app) if Sock else None
+memory_guard.init_app(app)
 
-# --- Key & BPM Detection Profiles ---
-NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
-MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+# Build every preset's CQT filter banks now, so forked workers inherit them instead of
+# building them on their first requests
+filter_cache.warm({(p['sr'], p['hop_length']) for p in QUALITY_PRESETS.values()}, tunings=tuning_grid())
 
 # --- Curated Database (Expandable) ---
 CURATED_SONGS_BY_KEY = {
@@ -171,125 +219,190 @@ CHORD_PROGRESSIONS = {
 }
 
 # --- Helper Functions ---
-def detect_tempo(y, sr):
-    """Enhanced tempo detection with multiple methods for accuracy."""
-    try:
-        # Method 1: Standard beat tracking
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        tempo = float(tempo) if np.isscalar(tempo) else float(np.mean(tempo))
-        
-        # Method 2: Onset detection for validation
-        onset_frames = librosa.onset.onset_detect(y=y, sr=sr)
-        if len(onset_frames) > 1:
-            onset_times = librosa.frames_to_time(onset_frames, sr=sr)
-            intervals = np.diff(onset_times)
-            if len(intervals) > 0:
-                avg_interval = np.median(intervals)
-                onset_tempo = 60.0 / avg_interval if avg_interval > 0 else tempo
-                
-                # Use onset tempo if it's reasonable and close to beat tempo
-                if 60 <= onset_tempo <= 200 and abs(tempo - onset_tempo) < 20:
-                    tempo = (tempo + onset_tempo) / 2
-        
-        # Adjust for common tempo ranges
-        if tempo > 200:
-            tempo = tempo / 2
-        elif tempo < 60:
-            tempo = tempo * 2
-            
-        return int(np.round(tempo))
-    except Exception as e:
-        print(f"Tempo detection error: {e}")
-        return 120  # Default BPM
+def analyze_in_memory(file_path, plan, quality, timeline):
+    """Decode the clip (or the planned windows) and run the DSP stages on it.
+
+    Yields ('tempo', tempo) as soon as it is known, then ('key', analysis);
+    or a single ('error', {...}).
+    """
+    sr = decode_sample_rate(quality)
+    with metrics.stage('decode'):
+        excerpts = audio_io.load_segments(file_path, sr, plan)
+    if plan:
+        # Windows come from inside the track, so there are no silent ends to trim
+        y = np.concatenate(excerpts)
+    else:
+        with metrics.stage('trim'):
+            y, _ = librosa.effects.trim(excerpts[0], top_db=20)
+        excerpts = [y]
+    
+    # Check if audio is valid
+    if len(y) < sr * 2:  # At least 2 seconds
+        yield 'error', {"error": "Audio clip too short (minimum 2 seconds required)"}
+        return
+    
+    if np.max(np.abs(y)) < 1e-5:
+        yield 'error', {"error": "Audio appears to be silent or too quiet"}
+        return
+    
+    # Analyze tempo and key
+    with metrics.stage('tempo'):
+        hop_length = tempo_hop_length(sr)
+        # One envelope per window so the autocorrelation never spans a join
+        envelopes = [librosa.onset.onset_strength(y=excerpt, sr=sr, hop_length=hop_length)
+                     for excerpt in excerpts]
+        # Kept for the clip's session statistics, so the autocorrelation runs once
+        tempo, tempo_stats = tempo_with_statistics(envelopes, sr / hop_length)
+        del excerpts, envelopes
+    yield 'tempo', tempo
+    # The timeline needs chroma for every frame, so it skips tonal gating
+    gate = timeline is None
+    with metrics.stage('tuning'):
+        # One frame_features pass serves both the tuning excerpt and the tonal gate
+        features = frame_features(y, sr) if gate else None
+        tuning = estimate_tuning(y, sr, features=features)
+    with metrics.stage('key'):
+        analysis = analyze_key(y, sr, quality, min_confidence=ADAPTIVE_MIN_CONFIDENCE, tuning=tuning,
+                               gate=gate, features=features)
+    if timeline is not None:
+        with metrics.stage('key_timeline'):
+            analysis['key_timeline'] = key_timeline(analysis['chroma'], analysis['sr'], analysis['hop_length'],
+                                                    window_seconds=timeline.get('window', 8.0),
+                                                    hop_seconds=timeline.get('hop', 2.0), duration=len(y) / sr)
+    analysis['statistics'] = clip_statistics(analysis.pop('chroma').mean(axis=1), len(y) / sr, tempo_stats)
+    analysis.update({'tempo': tempo, 'seconds': len(y) / sr})
+    yield 'key', analysis
 
-def detect_key(y, sr):
-    """Enhanced key detection with confidence scoring."""
+def analyze_streaming(file_path, timeline):
+    """Constant-memory analysis for very long recordings, read block by block.
+
+    Tempo and key come out of the same pass, so both are yielded together.
+    """
+    with metrics.stage('stream_analysis'):
+        input_sr, blocks = audio_io.stream_blocks(file_path, ANALYSIS_SR, STREAM_BLOCK_SECONDS)
+        analysis = analyze_blocks(blocks, input_sr, timeline)
+    if analysis is None:
+        yield 'error', {"error": "Audio appears to be silent or too quiet"}
+        return
+    analysis.update({'quality': 'accurate', 'tonal_fraction': 1.0})
+    yield 'tempo', analysis['tempo']
+    yield 'key', analysis
+
+def tempo_fields(tempo):
+    """Result fields for an estimate_tempo result (just a null bpm if there was no beat)."""
+    if not tempo:
+        return {'bpm': None}
+    return {
+        'bpm': tempo['bpm'],
+        'bpm_confidence': tempo['confidence'],
+        'bpm_candidates': tempo['candidates'],
+        'half_time_bpm': tempo['half_time']['bpm'],
+        'double_time_bpm': tempo['double_time']['bpm'],
+    }
+
+def session_fields(session):
+    """Combined key/BPM of every clip in an analysis session."""
+    fields = {'session_id': session['session_id'], 'clips': 0, 'seconds': 0.0, 'key': None, 'bpm': None}
+    if session['statistics']:
+        estimate = estimate_from_statistics(session['statistics'])
+        fields.update({
+            'clips': estimate['clips'],
+            'seconds': round(estimate['seconds'], 2),
+            'key': estimate['key'],
+            'key_confidence': round(estimate['confidence'], 1),
+            'alternative_keys': estimate['alternatives'],
+            'relative_key': estimate['relative_key'],
+            **tempo_fields(estimate['tempo']),
+        })
+    return fields
+
+def analysis_events(file_path, timeline=None, quality=None, full_track=False, session=None):
+    """Run the analysis as a sequence of (event, fields) pairs, each yielded when ready.
+
+    Events in order: 'accepted' (container facts), 'tempo', 'key', 'session'
+    (only with `session`, a (session_id, clip_hash) pair whose combined
+    estimate this clip updates), 'chords', 'identification', then 'result'
+    with every field merged. Any failure ends the sequence with
+    ('error', {...}). Raises admission.UploadRejected before the first event
+    for files that fail the pre-decode checks.
+    """
+    quality = quality or ANALYSIS_QUALITY
+    with metrics.stage('preflight'):
+        header = admission.preflight(file_path)
     try:
-        # Use CQT for better frequency resolution
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=512)
-        chroma_mean = np.mean(chroma, axis=1)
-        
-        # Normalize chroma
-        chroma_mean = chroma_mean / (np.sum(chroma_mean) + 1e-8)
-        
-        scores = []
-        for i in range(12):
-            major_profile = np.roll(MAJOR_PROFILE, i) / np.sum(MAJOR_PROFILE)
-            minor_profile = np.roll(MINOR_PROFILE, i) / np.sum(MINOR_PROFILE)
-            
-            # Use correlation coefficient
-            score_maj = np.corrcoef(chroma_mean, major_profile)[0,1]
-            score_min = np.corrcoef(chroma_mean, minor_profile)[0,1]
-            
-            # Handle NaN values
-            score_maj = score_maj if not np.isnan(score_maj) else 0
-            score_min = score_min if not np.isnan(score_min) else 0
-            
-            scores.append((score_maj, 'Major', NOTE_NAMES[i]))
-            scores.append((score_min, 'Minor', NOTE_NAMES[i]))
-        
-        # Sort by score
-        scores.sort(key=lambda x: x[0], reverse=True)
+        duration = header['duration']
+        # A timeline has to cover the whole track
+        plan = None if full_track or timeline is not None else plan_segments(duration)
+        streaming = (not plan and duration is not None and duration > STREAM_ANALYSIS_SECONDS
+                     and audio_io.can_stream(file_path))
         
-        # Calculate confidence
-        best_score = max(scores[0][0], 0)
-        second_best = max(scores[1][0], 0) if len(scores) > 1 else 0
-        confidence = min(100, max(0, (best_score - second_best) * 100 + 50))
+        # Refuse uploads whose decoded analysis would not fit in the memory budget
+        if not streaming:
+            budget_error = memory_guard.check_budget(sum(d for _, d in plan) if plan else duration,
+                                                     os.path.getsize(file_path))
+            if budget_error:
+                yield 'error', {"error": budget_error}
+                return
         
-        best = scores[0]
-        alternatives = [f"{s[2]} {s[1]}" for s in scores[1:4] if s[0] > 0.1]
-        
-        main_key = f"{best[2]} {best[1]}"
-        
-        # Calculate relative key
-        root_idx = NOTE_NAMES.index(best[2])
-        if best[1] == 'Major':
-            rel_idx = (root_idx + 9) % 12
-            relative_key = f"{NOTE_NAMES[rel_idx]} Minor"
-        else:
-            rel_idx = (root_idx + 3) % 12
-            relative_key = f"{NOTE_NAMES[rel_idx]} Major"
+        yield 'accepted', {
+            'duration': round(duration, 2) if duration else None,
+            'format': header['format'],
+            'sample_rate': header['sample_rate'],
+            'channels': header['channels'],
+        }
         
-        return main_key, confidence, alternatives, relative_key
+        result = {}
+        with memory_guard.track_peak():
+            stages = analyze_streaming(file_path, timeline) if streaming else analyze_in_memory(
+                file_path, plan, quality, timeline)
+            for event, payload in stages:
+                if event == 'error':
+                    yield 'error', payload
+                    return
+                if event == 'tempo':
+                    fields = tempo_fields(payload)
+                    result.update(fields)
+                    yield 'tempo', fields
+                else:
+                    analysis = payload
+        key, tuning = analysis['key'], analysis['tuning']
         
-    except Exception as e:
-        print(f"Key detection error: {e}")
-        return "C Major", 0, [], "A Minor"
-
-def analyze_audio_locally(file_path):
-    """Enhanced audio analysis with better error handling."""
-    try:
-        # Load audio
-        y, sr = librosa.load(file_path, sr=22050, mono=True)
-        y, _ = librosa.effects.trim(y, top_db=20)
-        
-        # Check if audio is valid
-        if len(y) < sr * 2:  # At least 2 seconds
-            return {"error": "Audio clip too short (minimum 2 seconds required)"}
+        fields = {
+            'key': key,
+            'key_confidence': round(analysis['confidence'], 1),
+            'alternative_keys': analysis['alternatives'],
+            'relative_key': analysis['relative_key'],
+            'analysis_quality': analysis['quality'],
+            'tuning_cents': tuning_cents(tuning),
+            'tonal_fraction': analysis['tonal_fraction'],
+            'analyzed_seconds': round(analysis['seconds'], 2),
+        }
+        if plan:
+            fields['analyzed_segments'] = [{'start': offset, 'duration': length} for offset, length in plan]
+        if timeline is not None:
+            fields['key_timeline'] = analysis['key_timeline']
+        if streaming:
+            fields['streamed'] = True
+        result.update(fields)
+        yield 'key', fields
         
-        if np.max(np.abs(y)) < 1e-5:
-            return {"error": "Audio appears to be silent or too quiet"}
+        if session is not None:
+            with metrics.stage('session'):
+                fields = {'session': session_fields(session_store.add_clip(*session, analysis['statistics']))}
+            result.update(fields)
+            yield 'session', fields
         
-        # Analyze tempo and key
-        bpm = detect_tempo(y, sr)
-        key, confidence, alternatives, relative_key = detect_key(y, sr)
+        fields = {'chord_progressions': CHORD_PROGRESSIONS.get(key, [])}
+        result.update(fields)
+        yield 'chords', fields
         
         # Try to identify the song using ACRCloud
-        song_info = identify_song_acrcloud(file_path)
-        
-        result = {
-            'key': key,
-            'key_confidence': round(confidence, 1),
-            'bpm': bpm,
-            'alternative_keys': alternatives,
-            'relative_key': relative_key,
-            'chord_progressions': CHORD_PROGRESSIONS.get(key, []),
-            'analysis_timestamp': datetime.now().isoformat()
-        }
+        with metrics.stage('acrcloud'):
+            song_info = identify_song_acrcloud(file_path)
         
         # Add song identification if found
         if song_info and song_info.get('status') == 'success':
-            result.update({
+            fields = {
                 'status': 'recognized',
                 'title': song_info.get('title'),
                 'artist': song_info.get('artist'),
@@ -297,27 +410,46 @@ def analyze_audio_locally(file_path):
                 'release_date': song_info.get('release_date'),
                 'spotify_url': song_info.get('spotify_url'),
                 'cover_art_url': song_info.get('cover_art_url')
-            })
+            }
         else:
-            result['status'] = 'not_recognized'
+            fields = {'status': 'not_recognized'}
+            if song_info and song_info.get('status') == 'throttled':
+                fields['recognition_skipped'] = song_info.get('error')
+        result.update(fields)
+        yield 'identification', fields
         
+        result['analysis_timestamp'] = datetime.now().isoformat()
         # Save analysis to Firebase for database building
         if db:
-            save_analysis_to_firebase(result)
+            with metrics.stage('firestore'):
+                save_analysis_to_firebase(result)
         
-        return result
+        yield 'result', result
         
     except Exception as e:
         print(f"Analysis error: {e}")
-        return {"error": f"Analysis failed: {str(e)}"}
+        yield 'error', {"error": f"Analysis failed: {str(e)}"}
+
+def analyze_audio_locally(file_path, timeline=None, quality=None, full_track=False, session=None):
+    """Enhanced audio analysis with better error handling.
+
+    `timeline` (a dict with optional 'window' and 'hop' seconds) adds per-section keys.
+    `quality` overrides ANALYSIS_QUALITY for this clip.
+    Long tracks are analyzed from a few representative windows unless `full_track`;
+    full-track analysis of very long recordings streams the file in blocks.
+    `session` adds the clip to a multi-clip analysis session (see analysis_events).
+    Raises admission.UploadRejected for files that fail the pre-decode checks.
+    """
+    for event, payload in analysis_events(file_path, timeline, quality, full_track, session):
+        if event in ('result', 'error'):
+            return payload
 
-def identify_song_acrcloud(file_path):
-    """Identify song using ACRCloud."""
+def identify_song_acrcloud(file_path, priority=PRIORITY_INTERACTIVE):
+    """Identify song using ACRCloud, rate limited by the shared scheduler."""
     try:
-        with open(file_path, 'rb') as f:
-            audio_data = f.read()
-        
-        result = acr.recognize_by_filebuffer(audio_data, 0)
+        # The extractor reads the file itself, so long uploads are never loaded into memory
+        result = acr_scheduler.call(acr.recognize_by_file, file_path, 0,
+                                    priority=priority, timeout=ACRCLOUD_DEADLINE_SECONDS)
         result_data = json.loads(result)
         
         if result_data.get('status', {}).get('code') == 0:
@@ -338,6 +470,9 @@ def identify_song_acrcloud(file_path):
         
         return {'status': 'not_found'}
         
+    except SchedulerRejected as e:
+        print(f"ACRCloud request skipped ({e.reason}): {e}")
+        return {'status': 'throttled', 'error': e.reason}
     except Exception as e:
         print(f"ACRCloud identification error: {e}")
         return {'status': 'error', 'error': str(e)}
@@ -396,7 +531,8 @@ def get_firebase_songs_by_key(key, genre, limit):
         
         query = db.collection('audio_analyses').where('key', '==', key).where('status', '==', 'recognized')
         
-        docs = query.limit(limit).stream()
+        with metrics.stage('firestore'):
+            docs = list(query.limit(limit).stream())
         songs = []
         
         for doc in docs:
@@ -427,7 +563,8 @@ def get_enhanced_artist_analysis(artist_name):
         
         # Try Genius API
         if genius:
-            artist = genius.search_artist(artist_name, max_songs=15, sort='popularity')
+            with metrics.stage('genius'):
+                artist = genius.search_artist(artist_name, max_songs=15, sort='popularity')
             if artist:
                 # Analyze artist's songs for patterns
                 songs_data = []
@@ -459,31 +596,369 @@ def get_enhanced_artist_analysis(artist_name):
 # --- API Endpoints ---
 
 @app.route('/analyze', methods=['POST'])
+@profiling.profiled
 def handle_analysis():
-    """Enhanced analysis endpoint with song recognition."""
-    if 'audio' not in request.files:
+    """Enhanced analysis endpoint with song recognition.
+
+    Send `Accept: text/event-stream` to receive each group of fields as a
+    server-sent event as soon as it is ready (see analysis_events); a cached
+    answer arrives as a single 'result' event.
+    """
+    # The body is parsed as it arrives: audio bytes go straight to disk and into the hash
+    try:
+        with metrics.stage('upload'):
+            form, upload = uploads.receive(request, app.config['UPLOAD_FOLDER'])
+    except admission.UploadRejected as e:
+        return jsonify({"error": str(e), "reason": e.reason}), e.status
+    if upload is None:
         return jsonify({"error": "No audio file provided"}), 400
-    
-    file = request.files['audio']
-    if not file or file.filename == '':
+    if not upload['filename'] or not upload['size']:
+        os.remove(upload['path'])
         return jsonify({"error": "Invalid file"}), 400
-    
-    # Save uploaded file
-    filename = f"audio_{int(time.time())}_{file.filename}"
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(file_path)
-    
+    return analysis_response(upload['path'], upload['sha256'], form)
+
+def server_sent_event(event, payload):
+    return f"event: {event}\ndata: {app.json.dumps(payload)}\n\n"
+
+def cache_result(cache_key, result):
+    # A session snapshot is only true at the time of the request
+    result_cache.put(cache_key, {name: value for name, value in result.items() if name != 'session'})
+
+def timeline_options(options):
+    """The key timeline settings requested in `options` (form fields or JSON): None, or {'window', 'hop'}.
+
+    Raises ValueError if timeline_window or timeline_hop is not a number.
+    """
+    if str(options.get('timeline', '')).lower() not in ('1', 'true', 'yes'):
+        return None
+    try:
+        return {name: min(60.0, max(0.5, float(options[f'timeline_{name}'])))
+                for name in ('window', 'hop') if options.get(f'timeline_{name}')}
+    except (TypeError, ValueError):
+        raise ValueError("timeline_window and timeline_hop must be numbers of seconds")
+
+def analysis_response(file_path, audio_hash, form, keep_file=False):
+    """Analyze a received upload and answer with JSON, or with server-sent events if the client accepts them.
+
+    `form` carries the analysis options (timeline, quality, full_track, session_id).
+    Takes ownership of `file_path` and removes it once the analysis is over,
+    unless `keep_file`.
+    """
+    g.audio_sha256 = audio_hash
+    accepted = request.accept_mimetypes.best_match(['application/json', 'text/event-stream'])
+    event_stream = accepted == 'text/event-stream'
+    handed_off = keep_file
     try:
-        # Analyze the audio
-        result = analyze_audio_locally(file_path)
-        return jsonify(result)
+        try:
+            timeline = timeline_options(form)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        quality = form.get('quality')
+        if quality and quality not in QUALITY_MODES:
+            return jsonify({"error": f"quality must be one of {', '.join(QUALITY_MODES)}"}), 400
+        full_track = form.get('full_track', '').lower() in ('1', 'true', 'yes')
+        
+        session = None
+        if form.get('session_id'):
+            try:
+                session = session_store.get(form['session_id'])
+            except analysis_sessions.SessionNotFound:
+                return jsonify({"error": "Unknown or expired session_id"}), 404
+        
+        # Identical audio with identical options gets the stored answer, unless a
+        # session still needs this clip's statistics
+        cache_key = result_cache.cache_key(audio_hash, quality=quality or ANALYSIS_QUALITY,
+                                           timeline=timeline, full_track=full_track)
+        clip = (session['session_id'], audio_hash) if session else None
+        cached = None
+        if session is None or audio_hash in session['clip_hashes']:
+            cached = result_cache.get(cache_key)
+        if cached:
+            cached['cached'] = True
+            if session is not None:
+                cached['session'] = session_fields(session)
+            if event_stream:
+                return Response(server_sent_event('result', cached), mimetype='text/event-stream')
+            return jsonify(cached)
+        
+        if not event_stream:
+            # Analyze the audio
+            result = analyze_audio_locally(file_path, timeline=timeline, quality=quality, full_track=full_track,
+                                           session=clip)
+            if 'error' not in result:
+                cache_result(cache_key, result)
+            return jsonify(result)
+        
+        events = analysis_events(file_path, timeline, quality, full_track, clip)
+        # Run the pre-decode checks before committing to a 200 event stream
+        first = next(events)
+        
+        def stream():
+            try:
+                yield server_sent_event(*first)
+                for event, payload in events:
+                    if event == 'result':
+                        cache_result(cache_key, payload)
+                    yield server_sent_event(event, payload)
+            finally:
+                events.close()
+                if not keep_file and os.path.exists(file_path):
+                    os.remove(file_path)
+        
+        handed_off = True
+        return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    except admission.UploadRejected as e:
+        return jsonify({"error": str(e), "reason": e.reason}), e.status
     
     finally:
-        # Clean up uploaded file
-        if os.path.exists(file_path):
+        # Clean up uploaded file (the event stream does it once it finishes)
+        if not handed_off and os.path.exists(file_path):
             os.remove(file_path)
 
+@app.route('/uploads', methods=['POST'])
+@profiling.profiled
+def create_upload():
+    """Start a resumable upload: {"filename", "size", optional "sha256"} -> session status.
+
+    Send the bytes with PUT /uploads/<id> (Content-Range: bytes start-end/size),
+    check progress with GET, then POST /uploads/<id>/finalize with the /analyze
+    options to run the analysis.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(upload_sessions.create(data.get('filename'), data.get('size'), data.get('sha256'))), 201
+    except uploads.SessionError as e:
+        return jsonify({"error": str(e)}), e.status
+    except admission.UploadRejected as e:
+        return jsonify({"error": str(e), "reason": e.reason}), e.status
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+@profiling.profiled
+def handle_upload(upload_id):
+    """Resume point (GET), next byte range (PUT) or cancellation (DELETE) of an upload."""
+    try:
+        if request.method == 'GET':
+            return jsonify(upload_sessions.status(upload_id))
+        if request.method == 'DELETE':
+            upload_sessions.delete(upload_id)
+            return jsonify({"deleted": upload_id})
+        start, total = None, None
+        if request.headers.get('Content-Range'):
+            content_range = parse_content_range_header(request.headers['Content-Range'])
+            if content_range is None:
+                return jsonify({"error": "Content-Range must look like 'bytes start-end/size'"}), 400
+            start, total = content_range.start, content_range.length
+        with metrics.stage('upload'):
+            status = upload_sessions.write(upload_id, request.stream, start, total)
+        return jsonify(status)
+    except uploads.SessionError as e:
+        body = {"error": str(e)}
+        if e.status == 409:
+            # Tell the client where to resume
+            try:
+                body.update(upload_sessions.status(upload_id))
+            except uploads.SessionError:
+                pass
+        return jsonify(body), e.status
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@profiling.profiled
+def finalize_upload(upload_id):
+    """Analyze a completed upload; takes the same options (form or JSON) and Accept modes as /analyze.
+
+    Finalizing again returns the same analysis, from the result cache when possible.
+    """
+    try:
+        file_path, audio_hash = upload_sessions.finalize(upload_id)
+    except uploads.SessionError as e:
+        body = {"error": str(e)}
+        if e.status == 409:
+            body.update(upload_sessions.status(upload_id))
+        return jsonify(body), e.status
+    form = {name: str(value) for name, value in (request.get_json(silent=True) or request.form).items()}
+    # The session keeps the file until it expires, so a retried finalize can be answered too
+    return analysis_response(file_path, audio_hash, form, keep_file=True)
+
+FEATURE_DTYPES = {'float16': '<f2', 'float32': '<f4'}
+FEATURE_MAX_FRAMES = int(os.getenv('FEATURE_MAX_FRAMES', 200000))
+
+def decode_feature_array(value, dtype, name):
+    """Base64 little-endian samples -> finite float32 array."""
+    try:
+        array = np.frombuffer(base64.b64decode(value, validate=True), dtype=FEATURE_DTYPES[dtype])
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be base64-encoded {dtype} values")
+    if len(array) > FEATURE_MAX_FRAMES * 12 or not np.all(np.isfinite(array)):
+        raise ValueError(f"{name} is too long or contains non-finite values")
+    return array.astype(np.float32)
+
+@app.route('/analyze_features', methods=['POST'])
+@profiling.profiled
+def handle_analysis_features():
+    """Key and BPM from client-computed features, with no audio decode or spectral analysis.
+
+    JSON body:
+      sr, hop_length       - analysis rate and chroma hop the features were computed with
+      chroma               - base64 frames x 12 chroma values, row-major (C, C#, ... B)
+      onset_envelope       - optional base64 onset strength; onset_hop_length defaults to hop_length
+      dtype                - 'float16' (default) or 'float32'
+      timeline, timeline_window, timeline_hop, session_id - as for /analyze
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        try:
+            sr, hop_length = int(data.get('sr', 0)), int(data.get('hop_length', 0))
+            onset_hop_length = int(data.get('onset_hop_length') or hop_length)
+        except (TypeError, ValueError):
+            raise ValueError("sr, hop_length and onset_hop_length must be integers")
+        if not (1000 <= sr <= 192000 and 0 < hop_length <= 65536 and 0 < onset_hop_length <= 65536):
+            raise ValueError("sr must be 1000-192000 Hz and hop lengths 1-65536 samples")
+        dtype = data.get('dtype', 'float16')
+        if dtype not in FEATURE_DTYPES:
+            raise ValueError(f"dtype must be one of {', '.join(FEATURE_DTYPES)}")
+        chroma = decode_feature_array(data.get('chroma', ''), dtype, 'chroma')
+        if len(chroma) % 12 or np.any(chroma < 0):
+            raise ValueError("chroma must hold 12 non-negative values per frame")
+        chroma = chroma.reshape(-1, 12).T
+        envelope = None
+        if data.get('onset_envelope'):
+            envelope = decode_feature_array(data['onset_envelope'], dtype, 'onset_envelope')
+        timeline = timeline_options(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    session = None
+    if data.get('session_id'):
+        try:
+            session = session_store.get(str(data['session_id']))
+        except analysis_sessions.SessionNotFound:
+            return jsonify({"error": "Unknown or expired session_id"}), 404
+    
+    seconds = chroma.shape[1] * hop_length / sr
+    if seconds < 2:
+        return jsonify({"error": "Audio clip too short (minimum 2 seconds required)"}), 422
+    if not chroma.any():
+        return jsonify({"error": "Audio appears to be silent or too quiet"}), 422
+    
+    # Same scoring and tempo estimation as /analyze, starting after the spectral stages
+    with metrics.stage('key'):
+        key, confidence, alternatives, relative_key = detect_key(None, sr, hop_length, chroma=chroma)
+    with metrics.stage('tempo'):
+        tempo, tempo_stats = None, None
+        if envelope is not None:
+            tempo, tempo_stats = tempo_with_statistics(envelope, sr / onset_hop_length)
+    
+    result = {
+        'key': key,
+        'key_confidence': round(confidence, 1),
+        'alternative_keys': alternatives,
+        'relative_key': relative_key,
+        'chord_progressions': CHORD_PROGRESSIONS.get(key, []),
+        'analysis_quality': 'features',
+        'analyzed_seconds': round(seconds, 2),
+        'analysis_timestamp': datetime.now().isoformat(),
+        **tempo_fields(tempo),
+    }
+    if timeline is not None:
+        with metrics.stage('key_timeline'):
+            result['key_timeline'] = key_timeline(chroma, sr, hop_length, window_seconds=timeline.get('window', 8.0),
+                                                  hop_seconds=timeline.get('hop', 2.0))
+    if session is not None:
+        with metrics.stage('session'):
+            envelopes = [] if envelope is None else [envelope]
+            clip_hash = hashlib.sha256(b''.join(a.tobytes() for a in [chroma] + envelopes)).hexdigest()
+            statistics = clip_statistics(chroma.mean(axis=1), seconds, tempo_stats)
+            result['session'] = session_fields(session_store.add_clip(session['session_id'], clip_hash, statistics))
+    
+    if db:
+        with metrics.stage('firestore'):
+            save_analysis_to_firebase(result)
+    return jsonify(result)
+
+@app.route('/sessions', methods=['POST'])
+@profiling.profiled
+def create_session():
+    """Start a multi-clip analysis session.
+
+    Pass the returned session_id with /analyze, /uploads/<id>/finalize or
+    /analyze_features: each clip then also returns the session's combined
+    key/BPM, updated from the new clip's statistics alone.
+    """
+    return jsonify(session_fields(session_store.create())), 201
+
+@app.route('/sessions/<session_id>', methods=['GET', 'DELETE'])
+@profiling.profiled
+def handle_session(session_id):
+    """Combined estimate of a session (GET), or end it (DELETE)."""
+    try:
+        if request.method == 'DELETE':
+            session_store.delete(session_id)
+            return jsonify({"deleted": session_id})
+        return jsonify(session_fields(session_store.get(session_id)))
+    except analysis_sessions.SessionNotFound:
+        return jsonify({"error": "Unknown or expired session_id"}), 404
+
+STREAM_FORMATS = {'pcm_s16le': ('<i2', 32768.0), 'f32le': ('<f4', 1.0)}
+STREAM_MAX_SECONDS = float(os.getenv('STREAM_MAX_SECONDS', 60))
+
+def handle_analysis_stream(ws):
+    """Live key/BPM while the user is still recording.
+
+    The client first sends a JSON config such as
+    {"sample_rate": 44100, "channels": 1, "format": "pcm_s16le"}, then binary
+    PCM chunks, then {"event": "end"}. After each chunk the server replies with
+    a provisional estimate. Once the estimate has settled it sets
+    "confident": true, and the client can stop recording early.
+    """
+    try:
+        config = json.loads(ws.receive(timeout=10) or '{}')
+        sample_rate = int(config.get('sample_rate', 44100))
+        channels = int(config.get('channels', 1))
+        dtype, scale = STREAM_FORMATS[config.get('format', 'pcm_s16le')]
+    except Exception:
+        ws.send(json.dumps({'event': 'error', 'error': 'Invalid stream config'}))
+        return
+    if not admission.MIN_SAMPLE_RATE <= sample_rate <= admission.MAX_SAMPLE_RATE:
+        ws.send(json.dumps({'event': 'error', 'error': f"Unsupported sample rate ({sample_rate} Hz); expected "
+                            f"{admission.MIN_SAMPLE_RATE}-{admission.MAX_SAMPLE_RATE} Hz"}))
+        return
+    if not 0 < channels <= admission.MAX_CHANNELS:
+        ws.send(json.dumps({'event': 'error', 'error': f"Unsupported channel count ({channels}); "
+                            f"the maximum is {admission.MAX_CHANNELS}"}))
+        return
+
+    analyzer = StreamingAnalyzer(sample_rate)
+    while True:
+        message = ws.receive(timeout=30)
+        if message is None or isinstance(message, str):
+            break
+        samples = np.frombuffer(message[:len(message) - len(message) % np.dtype(dtype).itemsize], dtype=dtype)
+        samples = samples.astype(np.float32) / scale
+        if channels > 1:
+            samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+        with metrics.stage('stream_chunk'):
+            analyzer.feed(samples)
+            estimate = analyzer.estimate()
+        ws.send(json.dumps({'event': 'provisional', **estimate}))
+        if analyzer.seconds >= STREAM_MAX_SECONDS:
+            break
+
+    analyzer.feed(np.zeros(0, dtype=np.float32), last=True)
+    final = analyzer.estimate()
+    if final['key'] is None:
+        ws.send(json.dumps({'event': 'error', 'error': 'Audio appears to be silent or too quiet'}))
+        return
+    final['chord_progressions'] = CHORD_PROGRESSIONS.get(final['key'], [])
+    ws.send(json.dumps({'event': 'final', **final}))
+
+if sock:
+    sock.route('/analyze_stream')(handle_analysis_stream)
+
 @app.route('/search_by_key', methods=['POST'])
+@profiling.profiled
 def handle_search_by_key():
     """Search songs by key and genre."""
     data = request.get_json()
@@ -505,6 +980,7 @@ def handle_search_by_key():
     })
 
 @app.route('/search_artist', methods=['POST'])
+@profiling.profiled
 def handle_search_artist():
     """Enhanced artist search with analysis."""
     data = request.get_json()
@@ -525,6 +1001,7 @@ def handle_search_artist():
         return jsonify({"error": result['error']}), 404
 
 @app.route('/get_chord_progressions', methods=['POST'])
+@profiling.profiled
 def handle_chord_progressions():
     """Get chord progressions for a specific key."""
     data = request.get_json()
@@ -550,9 +1027,64 @@ def health_check():
             'firebase': db is not None,
             'genius': genius is not None,
             'acrcloud': True
-        }
+        },
+        'acrcloud_scheduler': acr_scheduler.stats()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics: per-stage and per-endpoint latency histograms."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_request_profiles():
+    """List captured request profiles, newest first (optionally ?audio_hash=)."""
+    if not profiling.authorized(request):
+        return jsonify({"error": "Unauthorized"}), 401
+    profiles = profiling.list_profiles(request.args.get('audio_hash'))
+    return jsonify({'success': True, 'profiles': profiles, 'total': len(profiles)})
+
+@app.route('/admin/profiles/<request_id>', methods=['GET'])
+def download_request_profile(request_id):
+    """Download one profile (.pstats or collapsed-stack .folded file)."""
+    if not profiling.authorized(request):
+        return jsonify({"error": "Unauthorized"}), 401
+    entry, path = profiling.find_profile(request_id)
+    if not entry or not os.path.exists(path):
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, as_attachment=True, download_name=entry['file'])
+
+@metrics.register_collector
+def acrcloud_scheduler_metrics():
+    """Expose the ACRCloud scheduler's counters and queue-wait quantiles."""
+    stats = acr_scheduler.stats()
+    lines = ['# HELP keyfinder_acrcloud_scheduler_events_total ACRCloud scheduler outcomes.',
+             '# TYPE keyfinder_acrcloud_scheduler_events_total counter']
+    for name in ('submitted', 'completed', 'rejected_queue_full', 'rejected_quota',
+                 'dropped_deadline', 'throttled_by_acrcloud'):
+        lines.append(f'keyfinder_acrcloud_scheduler_events_total{{event="{name}"}} {stats[name]}')
+    lines += ['# HELP keyfinder_acrcloud_queue_depth Jobs waiting for an ACRCloud token.',
+              '# TYPE keyfinder_acrcloud_queue_depth gauge',
+              f"keyfinder_acrcloud_queue_depth {stats['queue_depth']}",
+              '# HELP keyfinder_acrcloud_queue_wait_seconds Time jobs spent queued before dispatch.',
+              '# TYPE keyfinder_acrcloud_queue_wait_seconds summary']
+    wait = stats['queue_wait_seconds']
+    lines.append(f'keyfinder_acrcloud_queue_wait_seconds{{quantile="0.5"}} {wait["p50"]}')
+    lines.append(f'keyfinder_acrcloud_queue_wait_seconds{{quantile="0.95"}} {wait["p95"]}')
+    return lines
+
+@metrics.register_collector
+def filter_cache_metrics():
+    """Expose the CQT/chroma filter cache size and hit rate."""
+    stats = filter_cache.stats()
+    return ['# HELP keyfinder_filter_cache_lookups_total CQT basis and chroma map cache lookups.',
+            '# TYPE keyfinder_filter_cache_lookups_total counter',
+            f'keyfinder_filter_cache_lookups_total{{result="hit"}} {stats["hits"]}',
+            f'keyfinder_filter_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+            '# HELP keyfinder_filter_cache_bytes Memory held by cached filter banks.',
+            '# TYPE keyfinder_filter_cache_bytes gauge',
+            f'keyfinder_filter_cache_bytes {stats["bytes"]}']
+
 if __name__ == '__main__':
     print("🎵 Music Producer Companion Server Starting...")
     print(f"📊 Curated songs database: {sum(len(songs) for songs in CURATED_SONGS_BY_KEY.values())} songs")
@@ -0,0 +1,306 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+import admission
+import audio_io
+import metrics
+
+# --- Configuration ---
+MAX_UPLOAD_MB = float(os.getenv('MAX_UPLOAD_MB', 200))
+UPLOAD_CHUNK_BYTES = 1 << 16
+MAX_FIELD_BYTES = 64 * 1024
+MAX_PARTS = 32
+# Bytes needed before the WAV header (and so its byte rate) can be read
+HEADER_PROBE_BYTES = 4096
+
+MB = 1024 * 1024
+
+UPLOAD_BYTES = metrics.Histogram(
+    'keyfinder_upload_bytes', 'Size of received audio uploads.',
+    buckets=tuple(mb * MB for mb in (0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 200)))
+
+
+def max_upload_bytes():
+    return int(MAX_UPLOAD_MB * MB)
+
+
+class _UploadSink:
+    """Writes one file part to disk, hashing it and enforcing the caps chunk by chunk."""
+
+    def __init__(self, folder, filename):
+        safe_name = ''.join(c for c in os.path.basename(filename or '') if c.isalnum() or c in '._-')[-80:]
+        self.path = os.path.join(folder, f"audio_{int(time.time())}_{uuid.uuid4().hex[:8]}_{safe_name}")
+        self.filename = filename
+        self.file = open(self.path, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.limit = max_upload_bytes()
+        self.probed = False
+
+    def _cap_duration(self):
+        """Tighten the byte limit for PCM WAV, whose header gives the exact byte rate."""
+        self.probed = True
+        self.file.flush()
+        if audio_io.sniff_format(self.path) != 'wav' or admission.MAX_DURATION_SECONDS <= 0:
+            return
+        layout = audio_io.wav_layout(self.path)
+        if layout:
+            rate, channels, dtype, _, data_offset, _ = layout
+            byte_rate = rate * channels * np.dtype(dtype).itemsize
+            # Leave room for metadata chunks (LIST, id3) after the samples
+            self.limit = min(self.limit, data_offset + int(admission.MAX_DURATION_SECONDS * byte_rate) + MB)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            if self.probed and self.limit < max_upload_bytes():
+                raise admission.reject(
+                    f"Audio too long; the maximum is {admission.MAX_DURATION_SECONDS / 60:.1f} min",
+                    'too_long', 413)
+            raise admission.reject(f"Upload too large; the maximum is {MAX_UPLOAD_MB:g} MB", 'too_large', 413)
+        self.digest.update(data)
+        self.file.write(data)
+        if not self.probed and self.size >= HEADER_PROBE_BYTES:
+            self._cap_duration()
+
+    def close(self):
+        self.file.close()
+        UPLOAD_BYTES.observe(self.size)
+        return {'path': self.path, 'filename': self.filename, 'size': self.size,
+                'sha256': self.digest.hexdigest()}
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _cleanup(sink, upload):
+    if sink is not None:
+        sink.discard()
+    if upload is not None and os.path.exists(upload['path']):
+        os.remove(upload['path'])
+
+
+def receive(req, folder, field='audio'):
+    """Parse a multipart/form-data body as it arrives.
+
+    Returns (form, upload). The `field` file part is written to `folder` and
+    hashed chunk by chunk, and never held in memory. `upload` is a dict with
+    path, filename, size and sha256, or None if the part is missing. Raises
+    admission.UploadRejected (413) once a size or duration cap is exceeded.
+    The caller owns the file at upload['path'].
+    """
+    mimetype, options = parse_options_header(req.headers.get('Content-Type', ''))
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        return {}, None
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_parts=MAX_PARTS)
+    form, upload = {}, None
+    sink, name, value = None, None, None
+    try:
+        while True:
+            chunk = req.stream.read(UPLOAD_CHUNK_BYTES)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File) and event.name == field and sink is None and upload is None:
+                    sink = _UploadSink(folder, event.filename)
+                elif isinstance(event, (Field, File)):
+                    # Other file parts are ignored; plain fields are kept up to MAX_FIELD_BYTES
+                    name, value = event.name, (bytearray() if isinstance(event, Field) else None)
+                elif isinstance(event, Data):
+                    if sink is not None:
+                        sink.write(event.data)
+                        if not event.more_data:
+                            upload, sink = sink.close(), None
+                    elif value is not None:
+                        value += event.data
+                        if len(value) > MAX_FIELD_BYTES:
+                            raise admission.reject(f"Form field '{name}' is too large", 'too_large', 413)
+                        if not event.more_data:
+                            form[name] = value.decode('utf-8', 'replace')
+                            value = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    except ValueError as e:
+        # MultipartDecoder's parse errors
+        _cleanup(sink, upload)
+        raise admission.reject(f"Malformed multipart body: {e}", 'malformed', 400)
+    except BaseException:
+        _cleanup(sink, upload)
+        raise
+    if sink is not None:
+        # Body ended inside the file part
+        sink.discard()
+        return form, None
+    return form, upload
+
+
+# --- Resumable Upload Sessions ---
+UPLOAD_SESSION_TTL_SECONDS = float(os.getenv('UPLOAD_SESSION_TTL_SECONDS', 24 * 3600))
+# Finalized sessions keep their audio this long so a repeated finalize is answered again
+UPLOAD_FINALIZED_TTL_SECONDS = float(os.getenv('UPLOAD_FINALIZED_TTL_SECONDS', 3600))
+UPLOAD_CHUNK_SUGGESTED_BYTES = 1 * MB
+
+
+class SessionError(Exception):
+    """A session request that can't be applied; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadSessions:
+    """Resumable uploads: create a session, PUT byte ranges in order, then finalize.
+
+    Each session is a .part file plus a .json sidecar in `folder`, so any
+    worker process can serve any request of an upload. The received offset is
+    the length of the .part file; ranges may overlap what is already there
+    (a retried chunk) but may not leave a gap.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if len(upload_id) != 32 or any(c not in '0123456789abcdef' for c in upload_id):
+            raise SessionError("Unknown upload", 404)
+        base = os.path.join(self.folder, upload_id)
+        return base + '.part', base + '.json'
+
+    def _load(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise SessionError("Unknown upload", 404)
+        if time.time() > meta['expires']:
+            self._remove(upload_id)
+            raise SessionError("Upload expired", 404)
+        return meta
+
+    def _save(self, meta):
+        _, meta_path = self._paths(meta['upload_id'])
+        temp_path = f"{meta_path}.{uuid.uuid4().hex[:8]}"
+        with open(temp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, meta_path)
+
+    def _remove(self, upload_id):
+        for path in self._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _status(self, meta):
+        part_path, _ = self._paths(meta['upload_id'])
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return {'upload_id': meta['upload_id'], 'offset': offset, 'size': meta['size'],
+                'complete': offset == meta['size'], 'state': meta['state'], 'expires': meta['expires'],
+                'chunk_bytes': UPLOAD_CHUNK_SUGGESTED_BYTES}
+
+    def sweep(self):
+        """Delete expired sessions."""
+        now = time.time()
+        for name in os.listdir(self.folder):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.folder, name)) as f:
+                    expired = now > json.load(f)['expires']
+            except (OSError, ValueError, KeyError):
+                expired = True
+            if expired:
+                try:
+                    self._remove(name[:-5])
+                except SessionError:
+                    pass
+
+    def create(self, filename, size, sha256=None):
+        """Open a session for `size` bytes; `sha256` (hex) is checked at finalize if given."""
+        self.sweep()
+        if not isinstance(size, int) or size <= 0:
+            raise SessionError("size must be a positive number of bytes")
+        if size > max_upload_bytes():
+            raise admission.reject(f"Upload too large; the maximum is {MAX_UPLOAD_MB:g} MB", 'too_large', 413)
+        if sha256 is not None:
+            if not isinstance(sha256, str) or len(sha256) != 64 or any(c not in '0123456789abcdefABCDEF' for c in sha256):
+                raise SessionError("sha256 must be a 64-character hex digest")
+        meta = {'upload_id': uuid.uuid4().hex, 'filename': str(filename or 'audio'), 'size': size,
+                'expected_sha256': sha256.lower() if sha256 is not None else None, 'sha256': None,
+                'state': 'open', 'expires': time.time() + UPLOAD_SESSION_TTL_SECONDS}
+        part_path, _ = self._paths(meta['upload_id'])
+        open(part_path, 'wb').close()
+        self._save(meta)
+        return self._status(meta)
+
+    def status(self, upload_id):
+        return self._status(self._load(upload_id))
+
+    def write(self, upload_id, stream, start=None, total=None):
+        """Write the request body at byte `start` (default: the current offset).
+
+        Bytes are flushed as they arrive, so a dropped connection keeps
+        everything received so far and the client resumes from `offset`.
+        """
+        meta = self._load(upload_id)
+        if meta['state'] != 'open':
+            raise SessionError("Upload already finalized", 409)
+        if total is not None and total != meta['size']:
+            raise SessionError(f"Content-Range total {total} does not match the upload size {meta['size']}")
+        part_path, _ = self._paths(upload_id)
+        offset = os.path.getsize(part_path)
+        start = offset if start is None else start
+        if start > offset:
+            raise SessionError(f"Range starts at {start} but only {offset} bytes were received", 409)
+        with open(part_path, 'r+b') as f:
+            f.seek(start)
+            position = start
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if position + len(chunk) > meta['size']:
+                    raise SessionError(f"Data runs past the declared size of {meta['size']} bytes", 413)
+                f.write(chunk)
+                f.flush()
+                position += len(chunk)
+        return self._status(meta)
+
+    def finalize(self, upload_id):
+        """Check a complete upload and return (path, sha256). Repeated calls return the same."""
+        meta = self._load(upload_id)
+        part_path, _ = self._paths(upload_id)
+        if meta['state'] == 'finalized':
+            return part_path, meta['sha256']
+        status = self._status(meta)
+        if not status['complete']:
+            raise SessionError(f"Upload incomplete: {status['offset']} of {meta['size']} bytes received", 409)
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(MB), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        if meta['expected_sha256'] and sha256 != meta['expected_sha256']:
+            raise SessionError("Checksum mismatch: the received bytes do not match sha256", 422)
+        UPLOAD_BYTES.observe(meta['size'])
+        meta.update(state='finalized', sha256=sha256,
+                    expires=min(meta['expires'], time.time() + UPLOAD_FINALIZED_TTL_SECONDS))
+        self._save(meta)
+        return part_path, sha256
+
+    def delete(self, upload_id):
+        self._load(upload_id)
+        self._remove(upload_id)